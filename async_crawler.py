@@ -0,0 +1,433 @@
+import time
+import uuid
+import asyncio
+import logging
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+import database as db
+import browser_pool
+import listing_index
+import uploader
+import checkpoint
+import metrics
+import tracing
+import normalize
+import frontier
+import rate_control
+import query_planner
+import http_scraper
+import scraper_aws as scraper
+
+# HTTP/2 needs the optional h2 package; fall back to keep-alive HTTP/1.1 without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# httpx logs every request at INFO, which would flood scraper.log
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+DEFAULT_CONCURRENCY = 100
+DEFAULT_PAGE_WORKERS = 4
+LINK_QUEUE_SIZE = 500
+
+def create_client(concurrency=DEFAULT_CONCURRENCY):
+    """Shared AsyncClient; httpx keeps a keep-alive connection pool per host"""
+    limits = httpx.Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+        keepalive_expiry=30
+    )
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=limits,
+        headers=http_scraper.DEFAULT_HEADERS,
+        timeout=httpx.Timeout(20.0, connect=10.0),
+        follow_redirects=True
+    )
+
+async def fetch_page(client, url, max_retries=3):
+    """GET a page and return its HTML, or None after max_retries failures
+
+    Rate limiting and overload handling as in http_scraper.fetch_page.
+    """
+    for attempt in range(max_retries):
+        await rate_control.wait_turn_async(url)
+        try:
+            response = await client.get(url)
+            if not rate_control.overloaded(url, response.status_code, response.text,
+                                           response.headers.get("Retry-After")):
+                if response.status_code == 200:
+                    return response.text
+                logging.warning(f"HTTP {response.status_code} for {url}")
+                if response.status_code == 404:
+                    return None
+        except httpx.TimeoutException as e:
+            rate_control.throttled(url, "timeout")
+            logging.warning(f"HTTP fetch attempt {attempt + 1} timed out for {url}: {e!r}")
+        except httpx.HTTPError as e:
+            logging.warning(f"HTTP fetch attempt {attempt + 1} failed for {url}: {e!r}")
+        if attempt < max_retries - 1:
+            metrics.RETRIES.labels(operation="http_fetch").inc()
+            await asyncio.sleep(rate_control.backoff(attempt))
+    return None
+
+async def produce_links(client, searches, start_page, end_page, link_queue, page_workers,
+                        checkpoint=None, progress=None):
+    """Fetch result pages concurrently and push their cards into link_queue
+
+    Same shard rotation, stopping rule and checkpoint handling as
+    scraper_aws.produce_links: an empty or failed page stops later pages of
+    its shard from being claimed. Queues a None sentinel when done.
+    """
+    shards = [{"next": start_page, "last": end_page} for _ in searches]
+    state = {"turn": 0, "found": 0}
+    pages_done = set()
+    # Parsing and checkpoint writes block, so they run off the event loop
+    loop = asyncio.get_running_loop()
+
+    def parse_page(url, page_html):
+        return scraper.parse_result_cards(http_scraper.parse_result_cards(
+            page_html, url, scraper.CARD_PRICE_SELECTOR, scraper.CARD_MILEAGE_SELECTOR
+        ))
+
+    def claim_page():
+        for _ in range(len(shards)):
+            shard = state["turn"]
+            state["turn"] = (shard + 1) % len(shards)
+            shard_state = shards[shard]
+            while query_planner.page_key(shard, shard_state["next"]) in pages_done:
+                shard_state["next"] += 1
+            page = shard_state["next"]
+            if page <= shard_state["last"]:
+                shard_state["next"] += 1
+                return shard, page
+        return None
+
+    async def page_worker():
+        while True:
+            claim = claim_page()
+            if claim is None:
+                break
+            shard, page = claim
+            label = f"Shard {shard} page {page}" if len(searches) > 1 else f"Page {page}"
+            url = scraper.build_url(searches[shard], page)
+            page_html = await fetch_page(client, url)
+            page_links = await loop.run_in_executor(None, parse_page, url, page_html) if page_html else []
+            if not page_links:
+                shard_state = shards[shard]
+                dropped = max(shard_state["last"] - (page - 1), 0)
+                shard_state["last"] = min(shard_state["last"], page - 1)
+                if progress and dropped:
+                    progress.results_end(dropped)
+                continue
+            logging.info(f"{label}: {len(page_links)} links")
+            if checkpoint:
+                page_links = await loop.run_in_executor(
+                    None, checkpoint.record_page, query_planner.page_key(shard, page), page_links,
+                    scraper.extract_car_id
+                )
+            state["found"] += len(page_links)
+            if progress:
+                progress.page_done(len(page_links))
+            for card in page_links:
+                await link_queue.put(card)
+
+    try:
+        if checkpoint:
+            pages_done = await loop.run_in_executor(None, checkpoint.pages_done)
+            pending = await loop.run_in_executor(None, checkpoint.pending_cards)
+            if pending or pages_done:
+                logging.info(f"Resuming: {len(pages_done)} pages already walked, {len(pending)} links pending")
+            state["found"] += len(pending)
+            if progress:
+                planned = {query_planner.page_key(shard, page)
+                           for shard in range(len(searches)) for page in range(start_page, end_page + 1)}
+                progress.resumed(len(pages_done & planned), len(pending))
+            for card in pending:
+                await link_queue.put(card)
+        workers = [asyncio.ensure_future(page_worker()) for _ in range(max(1, page_workers))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # One failed (or cancelled) worker stops the rest
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    except Exception as e:
+        logging.error(f"Link producer failed: {e}")
+    # Not in a finally: a cancelled producer has no consumer left to take it
+    await link_queue.put(None)
+    return state["found"]
+
+async def crawl_cars(
+    stock_type='all',
+    makes=None,
+    models=None,
+    zip_code='60606',
+    max_distance=50,
+    list_price_min=None,
+    list_price_max=None,
+    year_min=None,
+    year_max=None,
+    mileage_max=None,
+    body_styles=None,
+    fuel_types=None,
+    start_page=1,
+    end_page=1,
+    concurrency=DEFAULT_CONCURRENCY,
+    user_email=None,
+    extraction_mode=scraper.DEFAULT_EXTRACTION_MODE,
+    page_workers=DEFAULT_PAGE_WORKERS,
+    incremental=True,
+    freshness_ttl_hours=listing_index.DEFAULT_TTL_HOURS,
+    task_id=None,
+    progress=None,
+    shards=1,
+    shard_by=None
+):
+    """Event-loop crawler: bounded concurrent detail fetches over one connection pool
+
+    task_id, progress, shards and shard_by work as in scraper_aws.scrape_cars.
+    """
+    filters = scraper.build_filters(
+        stock_type, makes, models, zip_code, max_distance, list_price_min, list_price_max,
+        year_min, year_max, mileage_max, body_styles, fuel_types
+    )
+    logging.info(f"Async scraping started with filters: {filters} (concurrency={concurrency}, http2={HTTP2_AVAILABLE})")
+
+    searches = query_planner.plan_shards(filters, shards, shard_by)
+    if len(searches) > 1:
+        logging.info(f"Search split into {len(searches)} shards: {searches}")
+        # Result pages are cheap here; every shard gets its own page worker
+        page_workers = max(page_workers, len(searches))
+        if progress:
+            progress.sharded(len(searches))
+
+    loop = asyncio.get_running_loop()
+    pool = browser_pool.get_pool()
+    owns_pool = pool is None
+    if owns_pool:
+        pool = browser_pool.BrowserPool(scraper.setup_driver, size=scraper.HTTP_FALLBACK_DRIVERS,
+                                        max_lease_seconds=scraper.MAX_LEASE_SECONDS)
+    fallback = scraper.FallbackBrowsers(pool, extraction_mode=extraction_mode)
+    # Fallback scrapes block for seconds each; their own threads keep them
+    # from starving the default executor that SQLite and parsing run on
+    fallback_executor = ThreadPoolExecutor(max_workers=scraper.HTTP_FALLBACK_DRIVERS)
+    # Detail fetches in flight adapt between 1 and concurrency (AIMD)
+    limiter = rate_control.AdaptiveConcurrency(concurrency)
+    # Records are released once uploaded (see scraper_aws.scrape_cars)
+    scraped_count = 0
+    errors = []
+    seen_ids = []
+    shared_ids = []
+
+    completed = False
+
+    # Incremental mode: see scraper_aws.scrape_cars
+    index = listing_index.ListingIndex() if incremental else None
+    cards_by_id = {}
+    fresh_ids = []
+
+    job_checkpoint = checkpoint.JobCheckpoint(task_id) if task_id else None
+    link_frontier = frontier.LinkFrontier(task_id or uuid.uuid4().hex)
+
+    def release(records):
+        link_frontier.done([car["id"] for car in records])
+        for car in records:
+            cards_by_id.pop(car["id"], None)
+
+    def on_uploaded(batch_id, records):
+        if index:
+            index.record(records, cards_by_id)
+        if job_checkpoint:
+            job_checkpoint.record_batch(batch_id, records)
+        release(records)
+
+    def on_spooled(batch_id, records):
+        if job_checkpoint:
+            job_checkpoint.record_batch(batch_id, records)
+        release(records)
+
+    batch_uploader = uploader.BatchUploader(on_uploaded=on_uploaded, on_spooled=on_spooled)
+
+    def on_record(link, car_data):
+        # Runs on the normalization thread, so a full upload backlog blocks
+        # that thread rather than the event loop
+        nonlocal scraped_count
+        if job_checkpoint:
+            job_checkpoint.mark(link, checkpoint.SCRAPED, record=car_data)
+        scraped_count += 1
+        batch_uploader.put(car_data)
+
+    def on_rejected(link, error):
+        logging.error(f"Error scraping {link}: {error}")
+        errors.append({"link": link, "error": error})
+        link_frontier.release(scraper.extract_car_id(link))
+        if job_checkpoint:
+            job_checkpoint.mark(link, checkpoint.FAILED, error=str(error)[:500])
+
+    # Normalization is CPU work; batching it on a thread keeps it off the loop
+    normalizer = normalize.NormalizationStage(on_record, on_error=on_rejected)
+
+    async def handle_result(link, result):
+        if result and 'error' in result:
+            await loop.run_in_executor(None, on_rejected, link, result['error'])
+        elif result:
+            # put() blocks while the normalization backlog is full
+            await loop.run_in_executor(None, normalizer.put, link, result)
+
+    def admit_card(card):
+        """Whether this job should scrape the card's car; records why not otherwise"""
+        car_id = scraper.extract_car_id(card["url"])
+        if not link_frontier.first_sighting(car_id):
+            if job_checkpoint:
+                job_checkpoint.mark(card["url"], checkpoint.SHARED)
+            return False
+        seen_ids.append(car_id)
+        if index and index.is_fresh(car_id, card["price"], card["mileage"], freshness_ttl_hours):
+            fresh_ids.append(car_id)
+            if job_checkpoint:
+                job_checkpoint.mark(card["url"], checkpoint.SKIPPED)
+            if progress:
+                progress.car_skipped()
+            return False
+        outcome = link_frontier.admit(car_id, reuse_recent=incremental)
+        if outcome == frontier.RECENT:
+            # Another job just scraped and uploaded it: unchanged, like a fresh listing
+            fresh_ids.append(car_id)
+            if job_checkpoint:
+                job_checkpoint.mark(card["url"], checkpoint.SKIPPED)
+            if progress:
+                progress.car_skipped()
+            return False
+        if outcome != frontier.ADMITTED:
+            shared_ids.append(car_id)
+            if job_checkpoint:
+                job_checkpoint.mark(card["url"], checkpoint.SHARED)
+            if progress:
+                progress.car_skipped()
+            return False
+        cards_by_id[car_id] = card
+        return True
+
+    async def scrape_one(link, car_index):
+        with tracing.span("scrape_car_details_async", url=link):
+            await scrape_link(link, car_index)
+
+    async def scrape_link(link, car_index):
+        started = time.time()
+        try:
+            async with limiter.async_slot() as slot:
+                # Per-car latency excludes the time spent queued for a slot
+                started = time.time()
+                fetch_started = time.perf_counter()
+                page_html = await fetch_page(client, link)
+                metrics.observe_stage("detail_page_fetch", time.perf_counter() - fetch_started)
+                slot.ok = page_html is not None
+            # lxml parsing is CPU work; keep it off the event loop
+            car_data, needs_browser = await loop.run_in_executor(
+                None, scraper.parse_car_details_html, link, page_html
+            )
+            if needs_browser:
+                # Selenium is blocking; keep it off the event loop
+                car_data = await loop.run_in_executor(fallback_executor, fallback.scrape, link)
+        except Exception as e:
+            car_data = {"id": scraper.extract_car_id(link), "error": str(e)[:200]}
+        if progress:
+            progress.car_done(time.time() - started, ok=bool(car_data) and 'error' not in car_data)
+
+        try:
+            await handle_result(link, car_data)
+        except Exception as e:
+            logging.error(f"Error handling result for {link}: {e}")
+            errors.append({"link": link, "error": str(e)})
+
+        if (car_index + 1) % 10 == 0:
+            logging.info(f"Processed {car_index + 1} cars...")
+
+    try:
+        if job_checkpoint:
+            for card, record in await loop.run_in_executor(None, job_checkpoint.scraped_records):
+                cards_by_id[record["id"]] = card
+                await loop.run_in_executor(None, batch_uploader.put, record)
+
+        async with create_client(concurrency) as client:
+            # Detail tasks start as soon as the first results page yields links
+            link_queue = asyncio.Queue(maxsize=LINK_QUEUE_SIZE)
+            producer = asyncio.ensure_future(
+                produce_links(client, searches, start_page, end_page, link_queue, page_workers, job_checkpoint, progress)
+            )
+            # At most max_in_flight detail tasks exist at a time; the link
+            # queue (and so the producer) waits for one to finish
+            max_in_flight = concurrency * scraper.IN_FLIGHT_PER_WORKER
+            in_flight = set()
+            scheduled = 0
+            try:
+                while True:
+                    card = await link_queue.get()
+                    if card is None:
+                        break
+                    # Frontier, index and checkpoint lookups block on SQLite
+                    if not await loop.run_in_executor(None, admit_card, card):
+                        continue
+                    if len(in_flight) >= max_in_flight:
+                        _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    in_flight.add(asyncio.ensure_future(scrape_one(card["url"], scheduled)))
+                    scheduled += 1
+
+                logging.info(f"Found {await producer} car links, {scheduled} to process "
+                             f"({len(fresh_ids)} unchanged since last scrape, {len(shared_ids)} left to other jobs).")
+                if in_flight:
+                    await asyncio.wait(in_flight)
+            finally:
+                # After a failure or cancellation, stop the producer and the
+                # detail tasks before the client and the stages they feed close
+                tasks = [task for task in (producer, *in_flight) if not task.done()]
+                for task in tasks:
+                    task.cancel()
+                if tasks:
+                    await asyncio.gather(*tasks, return_exceptions=True)
+        completed = True
+    finally:
+        logging.info(f"Final concurrency limit: {limiter.limit} of {concurrency}")
+        limiter.close()
+        await loop.run_in_executor(None, fallback_executor.shutdown)
+        if progress:
+            progress.set_stage("uploading")
+        await loop.run_in_executor(None, normalizer.close)
+        upload_stats = await loop.run_in_executor(None, batch_uploader.close)
+        logging.info(f"Uploads: {upload_stats}")
+        await loop.run_in_executor(None, link_frontier.close)
+        if job_checkpoint:
+            fresh_ids = await loop.run_in_executor(None, job_checkpoint.car_ids, checkpoint.SKIPPED)
+            seen_ids = await loop.run_in_executor(None, job_checkpoint.car_ids)
+        if index:
+            await loop.run_in_executor(None, index.touch, fresh_ids)
+            index.close()
+        if completed:
+            # A failed or cancelled crawl saw only part of the scope; removal
+            # detection would mark the rest of its listings as gone
+            await loop.run_in_executor(
+                None, db.sync_listing_scope,
+                scraper.scope_key(filters, start_page, end_page, searches), seen_ids, fresh_ids
+            )
+        if job_checkpoint:
+            # An interrupted crawl keeps its checkpoint for resume
+            if completed:
+                await loop.run_in_executor(None, job_checkpoint.complete)
+            job_checkpoint.close()
+        if owns_pool:
+            await loop.run_in_executor(None, pool.close)
+
+    if progress:
+        progress.set_stage("done")
+    logging.info(f"Async scraping complete. Total: {scraped_count} cars, Errors: {len(errors)}")
+
+    if user_email:
+        await loop.run_in_executor(
+            None, scraper.notify_wordpress_scraping_complete, user_email, "Your scraping process is complete."
+        )
+
+    return {"cars": scraped_count, "errors": errors}
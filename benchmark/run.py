@@ -0,0 +1,214 @@
+"""Offline benchmark for scrape_cars against the local stand-in
+
+Runs every engine / max_workers combination in a fresh process against
+benchmark.standin (started here) and reports throughput, p50/p95 per-car
+latency, peak RSS and WordPress upload volume:
+
+    python -m benchmark.run --engines async,http --workers 4,16,64 --pages 5 --latency-ms 150
+
+The "http" and "selenium" engines walk results pages in Chrome, so they
+need Chrome and chromedriver installed; "async" needs neither.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+from benchmark import standin
+
+try:
+    import psutil
+except ImportError:  # peak RSS falls back to getrusage, which misses live Chrome children
+    psutil = None
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+class RssSampler:
+    """Peak resident memory of this process and its children (Chrome, chromedriver)"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        proc = psutil.Process()
+        while not self._stop.wait(self.interval):
+            try:
+                procs = [proc] + proc.children(recursive=True)
+                rss = 0
+                for p in procs:
+                    try:
+                        rss += p.memory_info().rss
+                    except psutil.Error:
+                        pass
+                self.peak_mb = max(self.peak_mb, rss / (1024 * 1024))
+            except psutil.Error:
+                pass
+
+    def start(self):
+        if psutil:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if psutil:
+            self._thread.join()
+            return round(self.peak_mb, 1)
+        import resource
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return round((own + children) / 1024.0, 1)
+
+def run_child(engine, workers, pages):
+    """Body of the per-configuration process; prints one JSON result line"""
+    import logging
+    import metrics
+    import progress
+    import scraper_aws as scraper
+    metrics.init()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    latencies = []
+
+    class LatencyProgress(progress.JobProgress):
+        def car_done(self, latency, ok=True):
+            latencies.append(latency)
+            super().car_done(latency, ok)
+
+    job_progress = LatencyProgress(1, pages)
+    sampler = RssSampler().start()
+    started = time.perf_counter()
+    result = scraper.scrape_cars(
+        start_page=1, end_page=pages, max_workers=workers, engine=engine,
+        incremental=False, progress=job_progress
+    )
+    elapsed = time.perf_counter() - started
+    peak_rss = sampler.stop()
+
+    cars = result["cars"]
+    print(json.dumps({
+        "engine": engine,
+        "workers": workers,
+        "cars": cars,
+        "errors": len(result["errors"]),
+        "seconds": round(elapsed, 2),
+        "cars_per_min": round(cars * 60 / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "peak_rss_mb": peak_rss,
+    }))
+
+def stats(base_url, reset=False):
+    request = urllib.request.Request(
+        f"{base_url}/__reset" if reset else f"{base_url}/__stats",
+        data=b"" if reset else None
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+def run_config(engine, workers, args, base_url):
+    stats(base_url, reset=True)
+    state_dir = tempfile.mkdtemp(prefix="scraper-bench-")
+    env = dict(
+        os.environ,
+        CARS_BASE_URL=base_url,
+        WORDPRESS_URL=base_url,
+        LISTING_INDEX_PATH=os.path.join(state_dir, "listing_index.db"),
+        WORDPRESS_SYNC_STATE_PATH=os.path.join(state_dir, "wordpress_sync.db"),
+        CHECKPOINT_PATH=os.path.join(state_dir, "checkpoints.db"),
+        FRONTIER_PATH=os.path.join(state_dir, "frontier.db"),
+        RATE_LIMIT_PATH=os.path.join(state_dir, "rate_limit.db"),
+        HOST_RATE_LIMIT=str(args.host_rate),
+        UPLOAD_SPOOL_DIR=os.path.join(state_dir, "spool"),
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(state_dir, "metrics"),
+        TRACE_DIR=os.path.join(state_dir, "traces"),
+    )
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [repo_root, env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmark.run", "--child", "--engines", engine,
+         "--workers", str(workers), "--pages", str(args.pages)],
+        cwd=repo_root, env=env, capture_output=True, text=True, timeout=args.timeout
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["no output"]
+        return {"engine": engine, "workers": workers, "failed": tail[0]}
+
+    result = json.loads(lines[-1])
+    upload = stats(base_url)
+    result.update(
+        upload_records=upload["upload_records"],
+        upload_kb=round(upload["upload_bytes"] / 1024, 1),
+        upload_kb_raw=round(upload["upload_bytes_raw"] / 1024, 1),
+        injected_errors=upload["injected_errors"],
+    )
+    return result
+
+COLUMNS = ("engine", "workers", "cars", "errors", "seconds", "cars_per_min", "p50_ms", "p95_ms",
+           "peak_rss_mb", "upload_records", "upload_kb", "upload_kb_raw")
+
+def print_table(results):
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in COLUMNS}
+    print("  ".join(c.rjust(widths[c]) for c in COLUMNS))
+    for r in results:
+        if "failed" in r:
+            print(f"{r['engine']:>{widths['engine']}}  {r['workers']:>{widths['workers']}}  failed: {r['failed']}")
+        else:
+            print("  ".join(str(r.get(c, "")).rjust(widths[c]) for c in COLUMNS))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scrape_cars benchmark")
+    parser.add_argument("--engines", default="async")
+    parser.add_argument("--workers", default="4,16")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=30.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--host-rate", type=float, default=0.0,
+                        help="per-host requests/sec limit for the scraper (0 = unlimited)")
+    parser.add_argument("--detail-padding-kb", type=int, default=0)
+    parser.add_argument("--timeout", type=int, default=1800, help="seconds per configuration")
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.engines, int(args.workers), args.pages)
+
+    server, _ = standin.serve(
+        args.port, pages=args.pages, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, detail_padding_kb=args.detail_padding_kb
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    try:
+        for engine in args.engines.split(","):
+            for workers in (int(w) for w in args.workers.split(",")):
+                result = run_config(engine, workers, args, base_url)
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+    finally:
+        server.shutdown()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Local stand-in for cars.com and the WordPress cars-scraper/v1 API
+
+Serves search-results and vehicle-detail pages rendered from the HTML
+fixtures in benchmark/fixtures, with optional injected latency and errors,
+and accepts WordPress uploads while counting records and bytes.
+
+    python -m benchmark.standin --port 8765 --pages 5 --latency-ms 150 --error-rate 0.02
+
+Point the scraper at it with CARS_BASE_URL=http://127.0.0.1:8765 and
+WORDPRESS_URL=http://127.0.0.1:8765. GET /__stats returns the counters and
+POST /__reset clears them.
+"""
+import os
+import gzip
+import json
+import time
+import random
+import string
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CARDS_PER_PAGE = 20
+
+MAKES = [("Honda", "Civic"), ("Toyota", "Camry"), ("Ford", "F-150"), ("Chevrolet", "Equinox"),
+         ("Tesla", "Model 3"), ("BMW", "X5"), ("Hyundai", "Elantra"), ("Subaru", "Outback")]
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return string.Template(f.read())
+
+def listing(car_id):
+    """Deterministic listing attributes for a stand-in car id"""
+    rng = random.Random(car_id)
+    make, model = rng.choice(MAKES)
+    price = rng.randrange(9000, 65000, 100)
+    mileage = rng.randrange(1000, 120000)
+    return {
+        "id": car_id,
+        "year": rng.randrange(2012, 2025),
+        "make": make,
+        "model": model,
+        "price_text": f"${price:,}",
+        "mileage_text": f"{mileage:,}",
+        "payment_text": f"${price // 55:,}",
+        "vin": "".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ0123456789") for _ in range(17)),
+    }
+
+class StandIn:
+    def __init__(self, pages=5, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, detail_padding_kb=0):
+        self.pages = pages
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.results = load_fixture("results.html")
+        self.card = load_fixture("card.html")
+        self.detail = load_fixture("detail.html")
+        # Real detail pages carry ~1MB of inline state; padding reproduces the parse cost
+        self.padding = json.dumps({"blob": "x" * (detail_padding_kb * 1024)})
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {
+                "results_pages": 0, "detail_pages": 0, "injected_errors": 0,
+                "upload_requests": 0, "upload_records": 0, "upload_bytes": 0, "upload_bytes_raw": 0,
+            }
+
+    def count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def render_results(self, page):
+        cards = []
+        if page <= self.pages:
+            for i in range(CARDS_PER_PAGE):
+                cards.append(self.card.substitute(listing(f"bench-{page}-{i}")))
+        return self.results.substitute(cards="\n".join(cards), page=page)
+
+    def render_detail(self, car_id):
+        thumbnails = "\n".join(
+            f'      <img src="/images/small/{car_id}-{i}.jpg" modal-src="/images/large/{car_id}-{i}.jpg" '
+            f'alt="Photo {i}">' for i in range(16)
+        )
+        return self.detail.substitute(listing(car_id), thumbnails=thumbnails, padding=self.padding)
+
+def make_handler(standin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send(self, status, body, content_type="text/html; charset=utf-8"):
+            data = body.encode("utf-8") if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def delay(self):
+            if standin.latency_ms or standin.jitter_ms:
+                time.sleep(max(0.0, random.gauss(standin.latency_ms, standin.jitter_ms)) / 1000.0)
+
+        def injected_error(self):
+            if standin.error_rate and random.random() < standin.error_rate:
+                standin.count(injected_errors=1)
+                self.send(503, "Service Unavailable")
+                return True
+            return False
+
+        def read_body(self):
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+                raw = b"".join(chunks)
+            else:
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = gzip.decompress(raw) if self.headers.get("Content-Encoding") == "gzip" else raw
+            return raw, body
+
+        def do_GET(self):
+            parsed = urllib.parse.urlparse(self.path)
+            if parsed.path == "/__stats":
+                return self.send(200, json.dumps(standin.snapshot()), "application/json")
+            if parsed.path.startswith("/wp-json/cars-scraper/v1/get-cars-data"):
+                return self.send(200, json.dumps({"cars_data": []}), "application/json")
+            if parsed.path.startswith("/images/"):
+                return self.send(200, b"", "image/jpeg")
+
+            self.delay()
+            if parsed.path.startswith("/shopping/results"):
+                if self.injected_error():
+                    return
+                page = int(urllib.parse.parse_qs(parsed.query).get("page", ["1"])[0])
+                standin.count(results_pages=1)
+                return self.send(200, standin.render_results(page))
+            if parsed.path.startswith("/vehicledetail/"):
+                if self.injected_error():
+                    return
+                standin.count(detail_pages=1)
+                return self.send(200, standin.render_detail(parsed.path.split("/")[2]))
+            self.send(404, "Not Found")
+
+        def do_POST(self):
+            path = urllib.parse.urlparse(self.path).path
+            raw, body = self.read_body()
+            if path == "/__reset":
+                standin.reset()
+                return self.send(200, "{}", "application/json")
+            if path.endswith("/update-cars-data"):
+                records = len(json.loads(body).get("cars_data", []))
+            elif path.endswith("/update-cars-data-ndjson"):
+                records = sum(1 for line in body.splitlines() if line.strip() and not line.startswith(b'{"_meta"'))
+            elif path.endswith("/scraping-complete"):
+                return self.send(200, "{}", "application/json")
+            else:
+                return self.send(404, "Not Found")
+            standin.count(upload_requests=1, upload_records=records,
+                          upload_bytes=len(raw), upload_bytes_raw=len(body))
+            self.send(200, json.dumps({"success": True}), "application/json")
+
+    return Handler
+
+def serve(port=8765, **options):
+    """Start the stand-in in a background thread; returns (server, standin)"""
+    standin = StandIn(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(standin))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, standin
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pages", type=int, default=5, help="results pages that have cards")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--detail-padding-kb", type=int, default=0)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(StandIn(
+        pages=args.pages, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, detail_padding_kb=args.detail_padding_kb
+    )))
+    print(f"Stand-in listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import metrics
+
+try:
+    import psutil
+except ImportError:  # RSS-based recycling is skipped without psutil
+    psutil = None
+
+DEFAULT_POOL_SIZE = 4
+MAX_PAGES_PER_DRIVER = 200      # recycle a browser after this many leases
+MAX_DRIVER_RSS_MB = 1024        # recycle when chromedriver + Chrome exceed this
+LEASE_WAIT_SECONDS = 120        # how long lease() waits for a free browser
+MAX_LEASE_SECONDS = 300         # a lease held longer than this is force-recycled
+HEALTH_CHECK_INTERVAL = 30      # seconds between idle-browser health checks
+
+class PoolTimeout(Exception):
+    """No browser became available within the lease wait timeout"""
+
+class PooledDriver:
+    __slots__ = ("driver", "pages", "created_at", "last_used", "leased_at", "expired", "suspect")
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.leased_at = None
+        self.expired = False
+        self.suspect = False
+
+def driver_rss_mb(driver):
+    """Resident memory of a chromedriver process and all its Chrome children"""
+    if psutil is None:
+        return None
+    try:
+        proc = psutil.Process(driver.service.process.pid)
+        procs = [proc] + proc.children(recursive=True)
+        return sum(p.memory_info().rss for p in procs) / (1024 * 1024)
+    except Exception:
+        return None
+
+def is_healthy(driver):
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+class BrowserPool:
+    """Process-wide pool of warm Chrome drivers shared across scrape jobs
+
+    Drivers are leased one page at a time, recycled after max_pages leases or
+    when their memory passes max_rss_mb, health-checked while idle and after
+    a failed page, and force-recycled if a lease is held longer than
+    max_lease_seconds.
+    """
+
+    def __init__(self, driver_factory, size=DEFAULT_POOL_SIZE, warm=0,
+                 max_pages=MAX_PAGES_PER_DRIVER, max_rss_mb=MAX_DRIVER_RSS_MB,
+                 lease_wait=LEASE_WAIT_SECONDS, max_lease_seconds=MAX_LEASE_SECONDS,
+                 health_interval=HEALTH_CHECK_INTERVAL):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.warm = min(warm, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.lease_wait = lease_wait
+        self.max_lease_seconds = max_lease_seconds
+        self.health_interval = health_interval
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._leased = set()
+        self._pending = 0
+        self._closed = False
+        self.created = 0
+        self.recycled = 0
+
+        for _ in range(self.warm):
+            self._add_idle()
+
+        self._maintenance = threading.Thread(target=self._maintain, daemon=True)
+        self._maintenance.start()
+
+    def _total(self):
+        return len(self._idle) + len(self._leased) + self._pending
+
+    def _publish(self):
+        """Export occupancy to /metrics; call with _cond held"""
+        metrics.POOL_DRIVERS.labels(state="idle").set(len(self._idle))
+        metrics.POOL_DRIVERS.labels(state="leased").set(len(self._leased))
+        metrics.POOL_DRIVERS.labels(state="starting").set(self._pending)
+
+    def _new_entry(self):
+        entry = PooledDriver(self.driver_factory())
+        with self._cond:
+            self.created += 1
+        return entry
+
+    def _add_idle(self):
+        try:
+            entry = self._new_entry()
+        except Exception as e:
+            logging.error(f"Browser pool could not start a driver: {e}")
+            return
+        with self._cond:
+            self._idle.append(entry)
+            self._publish()
+            self._cond.notify()
+
+    def _retire(self, entry, reason):
+        logging.info(f"Recycling browser after {entry.pages} pages ({reason})")
+        quit_driver(entry.driver)
+        # "rss 1234MB" -> "rss" keeps the label set small
+        metrics.DRIVER_RESTARTS.labels(reason=reason.split()[0] if reason.startswith("rss") else reason).inc()
+        with self._cond:
+            self.recycled += 1
+            self._publish()
+            self._cond.notify()
+
+    def acquire(self, timeout=None):
+        """Take a healthy driver from the pool, starting one if below size"""
+        deadline = time.time() + (self.lease_wait if timeout is None else timeout)
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("Browser pool is closed")
+                entry = self._idle.pop() if self._idle else None
+                start_new = entry is None and self._total() < self.size
+                if entry is None and not start_new:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No browser available after {self.lease_wait}s")
+                    self._cond.wait(remaining)
+                    continue
+                if start_new:
+                    self._pending += 1
+
+            if start_new:
+                try:
+                    entry = self._new_entry()
+                finally:
+                    with self._cond:
+                        self._pending -= 1
+            elif time.time() - entry.last_used > self.health_interval and not is_healthy(entry.driver):
+                self._retire(entry, "failed health check")
+                continue
+
+            with self._cond:
+                entry.leased_at = time.time()
+                self._leased.add(entry)
+                self._publish()
+            return entry
+
+    def release(self, entry, healthy=True):
+        """Return a leased driver, recycling it if it is worn out or broken"""
+        with self._cond:
+            self._leased.discard(entry)
+            self._publish()
+        entry.pages += 1
+        entry.last_used = time.time()
+        entry.leased_at = None
+        suspect, entry.suspect = entry.suspect, False
+
+        reason = None
+        if entry.expired:
+            reason = "lease timeout"
+        elif (suspect or not healthy) and not is_healthy(entry.driver):
+            reason = "unhealthy"
+        elif entry.pages >= self.max_pages:
+            reason = "page limit"
+        else:
+            rss = driver_rss_mb(entry.driver)
+            if rss is not None and rss > self.max_rss_mb:
+                reason = f"rss {rss:.0f}MB"
+
+        if reason or self._closed:
+            self._retire(entry, reason or "pool closed")
+            return
+        with self._cond:
+            self._idle.append(entry)
+            self._publish()
+            self._cond.notify()
+
+    def suspect(self, driver):
+        """Health-check a leased driver on release, e.g. after its page came back with an error
+
+        Scrapers report failures as results rather than exceptions, so a
+        crashed browser would otherwise go back to the idle list.
+        """
+        with self._cond:
+            for entry in self._leased:
+                if entry.driver is driver:
+                    entry.suspect = True
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """with pool.lease() as driver: ... -- one page of work per lease"""
+        entry = self.acquire(timeout)
+        healthy = True
+        try:
+            yield entry.driver
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self.release(entry, healthy)
+
+    def _maintain(self):
+        while True:
+            time.sleep(min(self.health_interval, 10))
+            with self._cond:
+                if self._closed:
+                    return
+                now = time.time()
+                idle = [e for e in self._idle if now - e.last_used >= self.health_interval]
+                overdue = [e for e in self._leased
+                           if not e.expired and e.leased_at and now - e.leased_at > self.max_lease_seconds]
+                for entry in idle:
+                    self._idle.remove(entry)
+                self._pending += len(idle)
+
+            for entry in overdue:
+                # Quitting makes the holder's next WebDriver call fail fast;
+                # release() then retires the entry.
+                logging.warning(f"Browser lease exceeded {self.max_lease_seconds}s; force-recycling")
+                entry.expired = True
+                quit_driver(entry.driver)
+
+            for entry in idle:
+                healthy = is_healthy(entry.driver)
+                with self._cond:
+                    self._pending -= 1
+                if healthy:
+                    entry.last_used = time.time()
+                    with self._cond:
+                        self._idle.append(entry)
+                        self._cond.notify()
+                else:
+                    self._retire(entry, "failed health check")
+
+            with self._cond:
+                missing = 0 if self._closed else min(self.warm - len(self._idle), self.size - self._total())
+            for _ in range(max(0, missing)):
+                self._add_idle()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "leased": len(self._leased),
+                "created": self.created,
+                "recycled": self.recycled,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._publish()
+            self._cond.notify_all()
+        for entry in idle:
+            quit_driver(entry.driver)
+
+# Process-wide pool, started and stopped with the server (see server_aws lifespan)
+_pool = None
+
+def start_pool(driver_factory, **kwargs):
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool(driver_factory, **kwargs)
+        logging.info(f"Browser pool started: {_pool.stats()}")
+    return _pool
+
+def get_pool():
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        logging.info("Browser pool shut down")
+        _pool = None
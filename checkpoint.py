@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import records as car_records
+
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", "/opt/cars-scraper/checkpoints.db")
+
+# Link states. A link is "scraped" once its record exists but has not reached
+# WordPress yet, and "done" once the batch containing it was uploaded (or
+# spooled for replay).
+PENDING = "pending"
+SCRAPED = "scraped"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"   # unchanged since the last scrape (listing index)
+SHARED = "shared"     # same car scraped via another link or by a concurrent job (frontier)
+
+class JobCheckpoint:
+    """On-disk progress of one scrape job so it can resume after a crash
+
+    Records the result pages already walked, every discovered link with its
+    card data and state, the scraped records that are not uploaded yet, and
+    the ids of uploaded batches. A resumed job skips finished pages and
+    links and re-uploads records that were scraped but never sent.
+    """
+
+    def __init__(self, task_id, path=CHECKPOINT_PATH):
+        self.task_id = task_id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                task_id TEXT, page INTEGER, links INTEGER, done_at REAL,
+                PRIMARY KEY (task_id, page)
+            );
+            CREATE TABLE IF NOT EXISTS links (
+                task_id TEXT, url TEXT, car_id TEXT, card TEXT, status TEXT,
+                record TEXT, error TEXT, updated_at REAL,
+                PRIMARY KEY (task_id, url)
+            );
+            CREATE INDEX IF NOT EXISTS links_car ON links (task_id, car_id);
+            CREATE TABLE IF NOT EXISTS batches (
+                task_id TEXT, batch_id TEXT, records INTEGER, uploaded_at REAL,
+                PRIMARY KEY (task_id, batch_id)
+            );
+        """)
+        self._conn.commit()
+
+    def pages_done(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT page FROM pages WHERE task_id = ?", (self.task_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def record_page(self, page, cards, car_id_fn):
+        """Store a page's cards and mark it walked; returns the cards not seen before"""
+        now = time.time()
+        new_cards = []
+        with self._lock:
+            for card in cards:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO links (task_id, url, car_id, card, status, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.task_id, card["url"], car_id_fn(card["url"]), json.dumps(card), PENDING, now)
+                )
+                if cursor.rowcount:
+                    new_cards.append(card)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (task_id, page, links, done_at) VALUES (?, ?, ?, ?)",
+                (self.task_id, page, len(cards), now)
+            )
+            self._conn.commit()
+        return new_cards
+
+    def pending_cards(self):
+        """Cards still to scrape: never finished, or failed on an earlier run"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT card FROM links WHERE task_id = ? AND status IN (?, ?)", (self.task_id, PENDING, FAILED)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def scraped_records(self):
+        """(card, record) pairs scraped on an earlier run but never uploaded"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT card, record FROM links WHERE task_id = ? AND status = ?", (self.task_id, SCRAPED)
+            ).fetchall()
+        return [(json.loads(card), car_records.CarRecord.from_upload(json.loads(record))) for card, record in rows]
+
+    def mark(self, url, status, record=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE links SET status = ?, record = ?, error = ?, updated_at = ? WHERE task_id = ? AND url = ?",
+                (status, json.dumps(record, default=car_records.json_default) if record is not None else None, error, time.time(),
+                 self.task_id, url)
+            )
+            self._conn.commit()
+
+    def record_batch(self, batch_id, records):
+        """An uploaded (or spooled) batch: its links are done for good"""
+        ids = [car["id"] for car in records]
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE links SET status = ?, record = NULL, updated_at = ? WHERE task_id = ? AND car_id = ?",
+                [(DONE, time.time(), self.task_id, car_id) for car_id in ids]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batches (task_id, batch_id, records, uploaded_at) VALUES (?, ?, ?, ?)",
+                (self.task_id, batch_id, len(ids), time.time())
+            )
+            self._conn.commit()
+
+    def car_ids(self, status=None):
+        query = "SELECT DISTINCT car_id FROM links WHERE task_id = ?"
+        args = [self.task_id]
+        if status:
+            query += " AND status = ?"
+            args.append(status)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, args).fetchall()]
+
+    def summary(self, task_id=None):
+        """Counts for this job, or for task_id when reading another job's checkpoint"""
+        task_id = task_id or self.task_id
+        with self._lock:
+            links = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM links WHERE task_id = ? GROUP BY status", (task_id,)
+            ).fetchall())
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages WHERE task_id = ?", (task_id,)).fetchone()[0]
+            batches = self._conn.execute(
+                "SELECT COUNT(*) FROM batches WHERE task_id = ?", (task_id,)
+            ).fetchone()[0]
+        return {"pages_done": pages, "links": links, "batches_uploaded": batches}
+
+    def complete(self):
+        """Drop the checkpoint once the job has finished cleanly"""
+        with self._lock:
+            for table in ("pages", "links", "batches"):
+                self._conn.execute(f"DELETE FROM {table} WHERE task_id = ?", (self.task_id,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
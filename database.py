@@ -1,22 +1,140 @@
 import os
 import json
+import time
+import gzip
+import zlib
+import hashlib
+import sqlite3
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+import metrics
+import records
 from datetime import datetime
 
 # WordPress REST API configuration
-WORDPRESS_URL = "https://online-app-flex-cars.com"  
+WORDPRESS_URL = os.environ.get("WORDPRESS_URL", "https://online-app-flex-cars.com")
 API_BASE = f"{WORDPRESS_URL}/wp-json/cars-scraper/v1"
+WORDPRESS_AUTH = ("Puneet", "MgMD pIbf hRkM EJq6 NJut n0cn")
 
-FIELDS = [
-    'id', 'title', 'price', 'mileage', 'exterior_color', 'interior_color',
-    'engine', 'transmission', 'drivetrain', 'fuel_type', 'mpg', 'vin',
-    'stock_', 'features_exterior', 'features_seating', 'features_safety',
-    'features_convenience', 'features_entertainment',
-    'additional_popular_features', 'all_features', 'images',
-    'start_payment', 'payment_breakdown', 'status_flag',
-    'make', 'model', 'status', 'year',
-    'bodystyle', 'location'
-]
+# Fields WordPress stores; records.CarRecord has exactly these slots
+FIELDS = records.FIELDS
+_FIELD_SET = frozenset(FIELDS)
+
+# Fingerprints of the last payload sent for each car, so repeat scrapes only
+# upload new or changed records
+SYNC_STATE_PATH = os.environ.get("WORDPRESS_SYNC_STATE_PATH", "/opt/cars-scraper/wordpress_sync.db")
+# A listing is reported removed once it has been missing from its search
+# scope for this long (pages shift as inventory changes, so one miss is not enough)
+REMOVAL_GRACE_HOURS = 48
+
+STATUS_NEW = "New Entry"
+STATUS_UPDATED = "Updated"
+STATUS_REMOVED = "Removed"
+
+_sync_lock = threading.Lock()
+_sync_conn = None
+
+def _sync_db():
+    global _sync_conn
+    if _sync_conn is None:
+        _sync_conn = sqlite3.connect(SYNC_STATE_PATH, timeout=30, check_same_thread=False)
+        _sync_conn.execute("PRAGMA journal_mode=WAL")
+        _sync_conn.execute("""
+            CREATE TABLE IF NOT EXISTS sent_cars (
+                id TEXT PRIMARY KEY,
+                fingerprint TEXT,
+                last_sent REAL,
+                last_seen REAL,
+                removed INTEGER DEFAULT 0
+            )
+        """)
+        _sync_conn.execute("""
+            CREATE TABLE IF NOT EXISTS scope_members (
+                scope TEXT,
+                id TEXT,
+                last_seen REAL,
+                PRIMARY KEY (scope, id)
+            )
+        """)
+        _sync_conn.commit()
+    return _sync_conn
+
+def sanitize_car(car, encode_nested=True):
+    """Keep only FIELDS; nested values are JSON-encoded unless encode_nested is False"""
+    if isinstance(car, records.CarRecord):
+        return car.to_upload(encode_nested)
+    if not encode_nested:
+        return {k: v for k, v in car.items() if k in _FIELD_SET}
+    return {k: (json.dumps(v) if isinstance(v, (dict, list)) else v) for k, v in car.items() if k in _FIELD_SET}
+
+def car_fingerprint(car, payload=None):
+    """Hash of everything WordPress stores for a car except the status flag
+
+    Hashed in upload form (pass payload when it is already built) so a record
+    and its spooled or checkpointed dict agree.
+    """
+    payload = payload if payload is not None else sanitize_car(car)
+    stable = {k: v for k, v in payload.items() if k != 'status_flag'}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _load_sent_state(ids):
+    known = {}
+    with _sync_lock:
+        conn = _sync_db()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT id, fingerprint, removed FROM sent_cars WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            known.update({row[0]: (row[1], row[2]) for row in rows})
+    return known
+
+class ChangeSet:
+    """Lazily diffs cars against the last payload sent for each id
+
+    Iterating yields only new or changed records, sanitized and with
+    status_flag set; unchanged ids and the fingerprints to store once the
+    upload succeeds are collected along the way.
+    """
+
+    def __init__(self, car_data_list, encode_nested=True):
+        self.cars = car_data_list
+        self.encode_nested = encode_nested
+        self.known = _load_sent_state([car['id'] for car in car_data_list])
+        self.unchanged_ids = []
+        self.fingerprints = {}
+
+    def __iter__(self):
+        self.unchanged_ids = []
+        self.fingerprints = {}
+        for car in self.cars:
+            payload = sanitize_car(car)
+            fingerprint = car_fingerprint(car, payload)
+            previous = self.known.get(car['id'])
+            if previous is None or previous[1]:
+                status_flag = STATUS_NEW
+            elif previous[0] != fingerprint:
+                status_flag = STATUS_UPDATED
+            else:
+                self.unchanged_ids.append(car['id'])
+                continue
+            self.fingerprints[car['id']] = fingerprint
+            record = payload if self.encode_nested else sanitize_car(car, encode_nested=False)
+            record['status_flag'] = status_flag
+            yield record
+
+def _record_sent(changes):
+    now = time.time()
+    unchanged_ids = changes.unchanged_ids
+    with _sync_lock:
+        conn = _sync_db()
+        conn.executemany(
+            "INSERT OR REPLACE INTO sent_cars (id, fingerprint, last_sent, last_seen, removed) VALUES (?, ?, ?, ?, 0)",
+            [(car_id, fingerprint, now, now) for car_id, fingerprint in changes.fingerprints.items()]
+        )
+        conn.executemany("UPDATE sent_cars SET last_seen = ? WHERE id = ?", [(now, i) for i in unchanged_ids])
+        conn.commit()
 
 def get_wordpress_nonce():
     """Get WordPress nonce for authentication"""
@@ -25,48 +143,187 @@ def get_wordpress_nonce():
     except Exception:
         return None
 
+# "json" posts one gzip-compressed JSON document per batch; "ndjson" streams
+# one record per line to the bulk endpoint as the batch is serialized.
+BULK_MODE = os.environ.get("WORDPRESS_BULK_MODE", "json")
+NDJSON_ENDPOINT = "update-cars-data-ndjson"
+GZIP_MIN_BYTES = 1024
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class WordPressClient:
+    """Keep-alive, gzip-capable client for the cars-scraper/v1 REST API"""
+
+    def __init__(self, api_base=API_BASE, auth=WORDPRESS_AUTH,
+                 compress=True, bulk_mode=BULK_MODE, timeout=30, pool_maxsize=10):
+        self.api_base = api_base
+        self.compress = compress
+        self.bulk_mode = bulk_mode
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.auth = auth
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept-Encoding': 'gzip, deflate'
+        })
+
+    def post_json(self, endpoint, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        headers = {'Content-Type': 'application/json'}
+        if self.compress and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        metrics.UPLOAD_BYTES.labels(format="json").observe(len(body))
+        with metrics.UPLOAD_SECONDS.labels(format="json").time():
+            response = self.session.post(f"{self.api_base}/{endpoint}", data=body, headers=headers, timeout=self.timeout)
+        return response.status_code == 200
+
+    def post_ndjson(self, endpoint, records, trailer):
+        """Stream records as NDJSON (chunked, optionally gzip) followed by a trailer line
+
+        trailer is a callable so it can report what was learned while the
+        records were being serialized.
+        """
+        def lines():
+            for record in records:
+                yield json.dumps(record, default=str).encode("utf-8") + b"\n"
+            yield json.dumps({"_meta": trailer()}, default=str).encode("utf-8") + b"\n"
+
+        sent = [0]
+
+        def counted(chunks):
+            for chunk in chunks:
+                sent[0] += len(chunk)
+                yield chunk
+
+        headers = {'Content-Type': 'application/x-ndjson'}
+        body = lines()
+        if self.compress:
+            body = _gzip_stream(body)
+            headers['Content-Encoding'] = 'gzip'
+        with metrics.UPLOAD_SECONDS.labels(format="ndjson").time():
+            response = self.session.post(
+                f"{self.api_base}/{endpoint}", data=counted(body), headers=headers, timeout=self.timeout
+            )
+        metrics.UPLOAD_BYTES.labels(format="ndjson").observe(sent[0])
+        return response.status_code == 200
+
+    def get_json(self, endpoint, params=None, timeout=10):
+        response = self.session.get(f"{self.api_base}/{endpoint}", params=params, timeout=timeout)
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    def update_cars(self, car_data_list):
+        """Send new/changed cars (see ChangeSet); True when WordPress accepted them"""
+        if not car_data_list:
+            return True
+
+        if self.bulk_mode == "ndjson":
+            # Nested fields go out as real JSON instead of JSON-in-a-string
+            changes = ChangeSet(car_data_list, encode_nested=False)
+            ok = self.post_ndjson(NDJSON_ENDPOINT, changes, lambda: {
+                'unchanged_ids': changes.unchanged_ids,
+                'timestamp': datetime.now().isoformat()
+            })
+        else:
+            changes = ChangeSet(car_data_list)
+            changed = list(changes)
+            ok = self.post_json("update-cars-data", {
+                'cars_data': changed,
+                'unchanged_ids': changes.unchanged_ids,
+                'timestamp': datetime.now().isoformat()
+            })
+
+        if ok:
+            _record_sent(changes)
+        return ok
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Process-wide WordPressClient so every upload reuses the same connections"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WordPressClient()
+        return _client
+
 def update_wordpress_database(car_data_list):
-    """Update WordPress database via REST API"""
+    """Update WordPress database via REST API
+
+    Takes records.CarRecord objects or their upload dicts, and leaves them
+    unchanged. Only new or changed cars are sent in full (status_flag "New
+    Entry" or "Updated"); cars identical to the last payload we sent are
+    listed in 'unchanged_ids' as a heartbeat. last_updated is never sent
+    (sanitize_car keeps only FIELDS), so MySQL can auto-update it.
+    """
     try:
-        # Remove 'last_updated' from each record so MySQL can auto-update it
-        for car in car_data_list:
-            car.pop('last_updated', None)
-        
-        # Send data to WordPress REST API endpoint
-        username = "Puneet"
-        app_password = "MgMD pIbf hRkM EJq6 NJut n0cn"
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
+        return get_client().update_cars(car_data_list)
+    except Exception as e:
+        print(f"Database update error: {e}")
+        return False
+
+def sync_listing_scope(scope_key, seen_ids, unchanged_ids=()):
+    """Finish a scrape of one search scope
+
+    Sends a heartbeat for listings that were skipped as unchanged and marks
+    listings that have been missing from the scope for REMOVAL_GRACE_HOURS
+    as "Removed".
+    """
+    try:
+        now = time.time()
+        cutoff = now - REMOVAL_GRACE_HOURS * 3600
+        with _sync_lock:
+            conn = _sync_db()
+            conn.executemany(
+                "INSERT OR REPLACE INTO scope_members (scope, id, last_seen) VALUES (?, ?, ?)",
+                [(scope_key, car_id, now) for car_id in seen_ids]
+            )
+            conn.commit()
+            removed_ids = [row[0] for row in conn.execute(
+                "SELECT m.id FROM scope_members m JOIN sent_cars s ON s.id = m.id "
+                "WHERE m.scope = ? AND m.last_seen < ? AND s.removed = 0 AND s.last_seen < ?",
+                (scope_key, cutoff, cutoff)
+            )]
         
-        def sanitize_car(car):
-            return {k: (json.dumps(v) if isinstance(v, (dict, list)) else v) for k, v in car.items() if k in FIELDS}
+        unchanged_ids = list(unchanged_ids)
+        if not removed_ids and not unchanged_ids:
+            return True
         
         payload = {
-            'cars_data': [sanitize_car(car) for car in car_data_list],
+            'cars_data': [{'id': car_id, 'status_flag': STATUS_REMOVED} for car_id in removed_ids],
+            'unchanged_ids': unchanged_ids,
             'timestamp': datetime.now().isoformat()
         }
-        
-        response = requests.post(
-            f"{API_BASE}/update-cars-data",
-            json=payload,
-            headers=headers,
-            auth=(username, app_password),
-            timeout=30
-        )
-        
-        return response.status_code == 200
+        ok = get_client().post_json("update-cars-data", payload)
+        if ok:
+            with _sync_lock:
+                conn = _sync_db()
+                conn.executemany("UPDATE sent_cars SET removed = 1 WHERE id = ?", [(i,) for i in removed_ids])
+                conn.executemany("UPDATE sent_cars SET last_seen = ? WHERE id = ?", [(now, i) for i in unchanged_ids])
+                conn.commit()
+        return ok
     except Exception as e:
-        print(f"Database update error: {e}")
+        print(f"Database sync error: {e}")
         return False
 
 def get_cars_data_from_wordpress(limit=100):
     """Get cars data from WordPress via REST API"""
     try:
-        response = requests.get(f"{API_BASE}/get-cars-data?limit={limit}", timeout=10)
-        if response.status_code == 200:
-            return response.json().get('cars_data', [])
+        data = get_client().get_json("get-cars-data", params={"limit": limit})
+        if data is not None:
+            return data.get('cars_data', [])
         else:
             return []
     except Exception as e:
@@ -21,6 +21,23 @@ cp requirements.txt $APP_DIR/
 cp server_aws.py $APP_DIR/server.py
 cp scraper_aws.py $APP_DIR/scraper.py
 cp ../database.py $APP_DIR/
+cp http_scraper.py $APP_DIR/
+cp async_crawler.py $APP_DIR/
+cp browser_pool.py $APP_DIR/
+cp listing_index.py $APP_DIR/
+cp uploader.py $APP_DIR/
+cp job_queue.py $APP_DIR/
+cp checkpoint.py $APP_DIR/
+cp progress.py $APP_DIR/
+cp metrics.py $APP_DIR/
+cp tracing.py $APP_DIR/
+cp normalize.py $APP_DIR/
+cp records.py $APP_DIR/
+cp frontier.py $APP_DIR/
+cp wordpress_probe.py $APP_DIR/
+cp query_planner.py $APP_DIR/
+cp rate_control.py $APP_DIR/
+cp scheduler.py $APP_DIR/
 
 # Set up virtual environment
 cd $APP_DIR
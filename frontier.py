@@ -0,0 +1,112 @@
+import os
+import time
+import sqlite3
+import threading
+
+FRONTIER_PATH = os.environ.get("FRONTIER_PATH", "/opt/cars-scraper/frontier.db")
+# A car scraped by any job this recently is not fetched again by another
+REUSE_MINUTES = float(os.environ.get("FRONTIER_REUSE_MINUTES", "30"))
+# A claim whose job stopped without finishing or releasing it expires after this
+CLAIM_TTL_MINUTES = 15
+
+# admit() outcomes
+ADMITTED = "admitted"      # this job should scrape the car
+IN_FLIGHT = "in_flight"    # another job is scraping it right now
+RECENT = "recent"          # another job scraped and uploaded it within REUSE_MINUTES (incremental only)
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+class LinkFrontier:
+    """Which job scrapes which vehicledetail id, shared by every worker process
+
+    Each job admits the cars it finds; a car is scraped by the first job to
+    claim it and skipped by jobs that find it while that claim is in flight
+    or shortly after it finished. The uploading job's record reaches
+    WordPress either way, so overlapping searches stop doing the same work.
+    """
+
+    def __init__(self, owner, path=FRONTIER_PATH, reuse_minutes=REUSE_MINUTES,
+                 claim_ttl_minutes=CLAIM_TTL_MINUTES):
+        self.owner = owner
+        self.reuse_seconds = reuse_minutes * 60
+        self.claim_ttl_seconds = claim_ttl_minutes * 60
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS claims (
+                car_id TEXT PRIMARY KEY,
+                owner TEXT,
+                state TEXT,
+                claimed_at REAL,
+                finished_at REAL
+            )
+        """)
+
+    def first_sighting(self, car_id):
+        """True the first time this job finds car_id (sponsored cards repeat across pages)"""
+        with self._lock:
+            if car_id in self._seen:
+                return False
+            self._seen.add(car_id)
+            return True
+
+    def admit(self, car_id, reuse_recent=True):
+        """Decide whether this job scrapes car_id; returns one of the outcomes above
+
+        With reuse_recent False (a full, non-incremental refresh) a car
+        another job recently uploaded is scraped again; only IN_FLIGHT
+        cars are left to the job scraping them.
+        """
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT owner, state, claimed_at, finished_at FROM claims WHERE car_id = ?", (car_id,)
+                ).fetchone()
+                outcome = ADMITTED
+                if row and row[0] != self.owner:
+                    owner, state, claimed_at, finished_at = row
+                    if state == IN_PROGRESS and now - claimed_at < self.claim_ttl_seconds:
+                        outcome = IN_FLIGHT
+                    elif reuse_recent and state == DONE and now - finished_at < self.reuse_seconds:
+                        outcome = RECENT
+                if outcome == ADMITTED:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO claims (car_id, owner, state, claimed_at, finished_at) "
+                        "VALUES (?, ?, ?, ?, NULL)",
+                        (car_id, self.owner, IN_PROGRESS, now)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return outcome
+
+    def done(self, car_ids):
+        """Cars whose records were uploaded (or spooled) by this job"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE claims SET state = ?, finished_at = ? WHERE car_id = ? AND owner = ?",
+                [(DONE, now, car_id, self.owner) for car_id in car_ids]
+            )
+
+    def release(self, car_id):
+        """Give up a claim (the scrape failed) so the next job that finds the car fetches it"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM claims WHERE car_id = ? AND owner = ? AND state = ?", (car_id, self.owner, IN_PROGRESS)
+            )
+
+    def close(self):
+        """Release every claim this job left unfinished and prune expired rows"""
+        cutoff = time.time() - max(self.reuse_seconds, self.claim_ttl_seconds)
+        with self._lock:
+            self._conn.execute("DELETE FROM claims WHERE owner = ? AND state = ?", (self.owner, IN_PROGRESS))
+            self._conn.execute("DELETE FROM claims WHERE COALESCE(finished_at, claimed_at) < ?", (cutoff,))
+            self._conn.close()
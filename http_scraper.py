@@ -0,0 +1,192 @@
+import time
+import logging
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
+from lxml.cssselect import CSSSelector
+import metrics
+import rate_control
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# Selectors are compiled to XPath once at import time and reused for every page.
+SEL_BASICS_SECTION = CSSSelector(".basics-section")
+SEL_TITLE = CSSSelector("h1.listing-title")
+SEL_PRICE = CSSSelector("span[data-qa='primary-price']")
+SEL_STATUS = CSSSelector("p.new-used")
+SEL_SELLER = CSSSelector("h3.spark-heading-5.heading.seller-name")
+SEL_BASICS_DL = CSSSelector(".basics-section dl.fancy-description-list")
+SEL_FEATURES_DL = CSSSelector(".features-section dl.fancy-description-list")
+SEL_DT = CSSSelector("dt")
+SEL_DD = CSSSelector("dd")
+SEL_FEATURE_ITEMS = CSSSelector("ul.vehicle-features-list li")
+SEL_ADDITIONAL_FEATURES = CSSSelector(".auto-corrected-feature-list")
+SEL_ALL_FEATURES_BUTTON = CSSSelector("spark-button[data-target='#allFeaturesModal']")
+SEL_ALL_FEATURES_ITEMS = CSSSelector(".all-features-list .all-features-item")
+SEL_THUMBNAILS = CSSSelector("gallery-thumbnails img")
+SEL_RECALL_LINK = CSSSelector("a.sds-link--ext[data-linkname='check-recalls']")
+SEL_DEALER_ADDRESS = CSSSelector(".dealer-address")
+SEL_PAYMENT_RESULT = CSSSelector("#payment-result-value")
+
+SEL_VEHICLE_CARDS = CSSSelector("div.vehicle-card")
+SEL_CARD_LINK = CSSSelector("a.vehicle-card-link")
+
+_selector_cache = {}
+
+def compiled(selector):
+    """Return a cached compiled CSSSelector"""
+    sel = _selector_cache.get(selector)
+    if sel is None:
+        sel = _selector_cache[selector] = CSSSelector(selector)
+    return sel
+
+def create_session(pool_maxsize=10):
+    """requests Session with keep-alive connection pooling sized for the worker count"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+def fetch_page(session, url, max_retries=3, timeout=20):
+    """GET a page and return its HTML, or None after max_retries failures
+
+    Requests wait for the host's rate limit; 429s, block pages and timeouts
+    are reported to rate_control before backing off.
+    """
+    for attempt in range(max_retries):
+        if attempt:
+            metrics.RETRIES.labels(operation="http_fetch").inc()
+            time.sleep(rate_control.backoff(attempt - 1))
+        rate_control.wait_turn(url)
+        try:
+            response = session.get(url, timeout=timeout)
+            if rate_control.overloaded(url, response.status_code, response.text,
+                                       response.headers.get("Retry-After")):
+                continue
+            if response.status_code == 200:
+                return response.text
+            logging.warning(f"HTTP {response.status_code} for {url}")
+            if response.status_code == 404:
+                return None
+        except requests.Timeout as e:
+            rate_control.throttled(url, "timeout")
+            logging.warning(f"HTTP fetch attempt {attempt + 1} timed out for {url}: {e}")
+        except requests.RequestException as e:
+            logging.warning(f"HTTP fetch attempt {attempt + 1} failed for {url}: {e}")
+    return None
+
+def _first(selector, root):
+    found = selector(root)
+    return found[0] if found else None
+
+def _text(el):
+    """Whitespace-collapsed text of an element, like Selenium's .text for inline content"""
+    if el is None:
+        return None
+    return " ".join(el.text_content().split())
+
+def _lines(el):
+    """Text of an element keeping one line per text block, like innerText"""
+    if el is None:
+        return None
+    lines = (" ".join(chunk.split()) for chunk in el.itertext())
+    return "\n".join(line for line in lines if line)
+
+def _pairs(dl):
+    if dl is None:
+        return []
+    return list(zip(SEL_DT(dl), SEL_DD(dl)))
+
+def parse_detail_html(page_html, image_indices, payment_selectors, breakdown_selectors, pair_selectors):
+    """Parse a server-rendered detail page into the raw extraction object
+
+    Produces the same shape as scraper_aws.DETAIL_EXTRACTION_JS so both paths
+    share normalize.normalize_record.
+    """
+    root = lxml_html.fromstring(page_html)
+    if not SEL_BASICS_SECTION(root):
+        return {"structure_missing": True}
+
+    data = {
+        "title": _text(_first(SEL_TITLE, root)),
+        "price": _text(_first(SEL_PRICE, root)),
+        "status": _text(_first(SEL_STATUS, root)),
+        "seller": _text(_first(SEL_SELLER, root)),
+        "basics": [[_text(dt), _text(dd)] for dt, dd in _pairs(_first(SEL_BASICS_DL, root))],
+        "features": [
+            [_text(dt), [_text(li) for li in SEL_FEATURE_ITEMS(dd)]]
+            for dt, dd in _pairs(_first(SEL_FEATURES_DL, root))
+        ],
+        "additional_features": _lines(_first(SEL_ADDITIONAL_FEATURES, root)),
+        "all_features": [_text(item) for item in SEL_ALL_FEATURES_ITEMS(root)],
+        "images": [],
+        "payment_text": None,
+        "breakdown": [],
+        "recall_href": None,
+        "location": _text(_first(SEL_DEALER_ADDRESS, root)),
+    }
+
+    thumbnails = SEL_THUMBNAILS(root)
+    for idx in image_indices:
+        if idx < len(thumbnails):
+            img = thumbnails[idx]
+            data["images"].append({"src": img.get("src"), "modal_src": img.get("modal-src"), "alt": img.get("alt")})
+
+    for selector in payment_selectors:
+        payment = _text(_first(compiled(selector), root))
+        if payment:
+            data["payment_text"] = payment
+            break
+
+    for selector in breakdown_selectors:
+        for section in compiled(selector)(root):
+            for title_sel, value_sel in pair_selectors:
+                dts = compiled(title_sel)(section)
+                dds = compiled(value_sel)(section)
+                if dts and dds:
+                    data["breakdown"].extend([_text(dt), _text(dd)] for dt, dd in zip(dts, dds))
+                    break
+            if any(title and value for title, value in data["breakdown"]):
+                break
+        else:
+            continue
+        break
+
+    recall = _first(SEL_RECALL_LINK, root)
+    if recall is not None:
+        data["recall_href"] = recall.get("href")
+
+    # Sections that only exist after client-side rendering
+    data["js_sections"] = []
+    if SEL_ALL_FEATURES_BUTTON(root) and not data["all_features"]:
+        data["js_sections"].append("all_features")
+    payment_result = _first(SEL_PAYMENT_RESULT, root)
+    if payment_result is not None and not _text(payment_result):
+        data["js_sections"].append("payment")
+
+    return data
+
+def parse_result_cards(page_html, page_url, price_selector, mileage_selector):
+    """Raw {"url", "price", "mileage"} cards from a server-rendered results page"""
+    root = lxml_html.fromstring(page_html)
+    price_sel = compiled(price_selector)
+    mileage_sel = compiled(mileage_selector)
+    cards = []
+    for card in SEL_VEHICLE_CARDS(root):
+        link = _first(SEL_CARD_LINK, card)
+        if link is not None and link.get("href"):
+            cards.append({
+                "url": urllib.parse.urljoin(page_url, link.get("href")),
+                "price": _text(_first(price_sel, card)),
+                "mileage": _text(_first(mileage_sel, card)),
+            })
+    return cards
@@ -0,0 +1,377 @@
+import os
+import json
+import time
+import signal
+import sqlite3
+import logging
+import threading
+import multiprocessing
+import progress
+import metrics
+import tracing
+
+QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "/opt/cars-scraper/jobs.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", os.cpu_count() or 2))
+
+# Maximum jobs of each engine running at once across all workers; Selenium
+# jobs are capped hardest because each one holds a pool of Chrome processes.
+ENGINE_JOB_CAPS = {
+    "selenium": int(os.environ.get("SELENIUM_JOB_CAP", 2)),
+    "http": int(os.environ.get("HTTP_JOB_CAP", 4)),
+    "async": int(os.environ.get("ASYNC_JOB_CAP", 4)),
+}
+
+MAX_ATTEMPTS = 3              # a job that crashes its worker this often is failed
+POLL_INTERVAL = 2.0           # idle workers check for new jobs this often
+HEARTBEAT_INTERVAL = 2        # running jobs refresh their heartbeat and progress this often
+HEARTBEAT_TIMEOUT = 120       # a running job with an older heartbeat is orphaned
+SUPERVISE_INTERVAL = 5        # seconds between supervisor checks
+
+# Per-worker Chrome pool (each worker process owns its own browsers)
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_BROWSER_POOL_SIZE", 4))
+WORKER_POOL_WARM = int(os.environ.get("WORKER_BROWSER_POOL_WARM", 0))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class JobQueue:
+    """Durable scrape-job queue in a local SQLite database
+
+    Shared by the API process (enqueue, status) and the worker processes
+    (claim, heartbeat, finish). Claims are atomic, so a job runs on exactly
+    one worker; jobs left running by a dead worker are re-queued by
+    recover().
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                engine TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_pid INTEGER,
+                heartbeat REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT,
+                progress TEXT
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "progress" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def enqueue(self, job_id, engine, params):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, engine, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, engine, json.dumps(params), QUEUED, time.time())
+            )
+        return job_id
+
+    def claim(self, worker_pid, caps=ENGINE_JOB_CAPS):
+        """Atomically take the oldest queued job whose engine is under its cap"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                running = dict(self._conn.execute(
+                    "SELECT engine, COUNT(*) FROM jobs WHERE status = ? GROUP BY engine", (RUNNING,)
+                ).fetchall())
+                open_engines = [e for e, cap in caps.items() if running.get(e, 0) < cap]
+                row = None
+                if open_engines:
+                    row = self._conn.execute(
+                        f"SELECT id, engine, params, attempts FROM jobs WHERE status = ? "
+                        f"AND engine IN ({','.join('?' * len(open_engines))}) ORDER BY created_at LIMIT 1",
+                        (QUEUED, *open_engines)
+                    ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, worker_pid = ?, "
+                    "heartbeat = ?, started_at = ? WHERE id = ?",
+                    (RUNNING, worker_pid, now, now, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": row[0], "engine": row[1], "params": json.loads(row[2]), "attempts": row[3] + 1}
+
+    def heartbeat(self, job_id, progress=None):
+        with self._lock:
+            if progress is None:
+                self._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id))
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET heartbeat = ?, progress = ? WHERE id = ?",
+                    (time.time(), json.dumps(progress), job_id)
+                )
+
+    def finish(self, job_id, result=None, error=None, progress=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, worker_pid = NULL, "
+                "progress = COALESCE(?, progress) WHERE id = ?",
+                (FAILED if error else DONE, time.time(), json.dumps(result) if result is not None else None,
+                 error, json.dumps(progress) if progress is not None else None, job_id)
+            )
+
+    def requeue(self, job_id):
+        """Put a job back, e.g. when its worker is shutting down mid-run
+
+        The interrupted attempt is not counted against MAX_ATTEMPTS.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, worker_pid = NULL WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING)
+            )
+
+    def resume(self, job_id):
+        """Re-queue a failed job from its checkpoint; returns its previous status
+
+        Queued, running and finished jobs are left alone. The attempt counter is reset so the job gets a fresh MAX_ATTEMPTS.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row and row[0] == FAILED:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = 0, error = NULL, finished_at = NULL WHERE id = ?",
+                        (QUEUED, job_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[0] if row else None
+
+    def recover(self, dead_pids=(), heartbeat_timeout=HEARTBEAT_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        """Re-queue running jobs whose worker died or stopped heartbeating
+
+        Jobs that have already used max_attempts are failed instead, so a job
+        that reliably crashes its worker cannot loop forever.
+        """
+        stale = time.time() - heartbeat_timeout
+        dead_pids = list(dead_pids)
+        where = "status = ? AND (heartbeat < ?"
+        args = [RUNNING, stale]
+        if dead_pids:
+            where += f" OR worker_pid IN ({','.join('?' * len(dead_pids))})"
+            args += dead_pids
+        where += ")"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                orphaned = self._conn.execute(f"SELECT id, attempts FROM jobs WHERE {where}", args).fetchall()
+                for job_id, attempts in orphaned:
+                    if attempts >= max_attempts:
+                        self._conn.execute(
+                            "UPDATE jobs SET status = ?, finished_at = ?, worker_pid = NULL, error = ? WHERE id = ?",
+                            (FAILED, time.time(), f"Worker died {attempts} times", job_id)
+                        )
+                    else:
+                        self._conn.execute(
+                            "UPDATE jobs SET status = ?, worker_pid = NULL WHERE id = ?", (QUEUED, job_id)
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for job_id, attempts in orphaned:
+            logging.warning(f"Recovered orphaned job {job_id} (attempt {attempts})")
+        return [job_id for job_id, _ in orphaned]
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, engine, params, status, attempts, worker_pid, created_at, started_at, "
+                "finished_at, result, error, progress FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "engine", "params", "status", "attempts", "worker_pid", "created_at", "started_at",
+                "finished_at", "result", "error", "progress")
+        job = dict(zip(keys, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        return job
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def run_job(job_id, params, job_progress=None):
+    """Run one scrape job in this process and return its summary
+
+    The job id doubles as the checkpoint key, so a job re-queued after a
+    crash or resumed through the API picks up where it stopped.
+    """
+    import scraper_aws as scraper
+    params = dict(params, task_id=job_id, progress=job_progress)
+    engine = params.pop("engine")
+    trace = params.pop("trace", False)
+    profiler = tracing.SamplingProfiler(job_id).start() if params.pop("profile", False) else None
+    if trace:
+        tracing.start_trace(job_id)
+    try:
+        with tracing.span("job", task_id=job_id, engine=engine):
+            if engine == "async":
+                import asyncio
+                import async_crawler
+                result = asyncio.run(async_crawler.crawl_cars(concurrency=params.pop("workers"), **params))
+            else:
+                result = scraper.scrape_cars(max_workers=params.pop("workers"), engine=engine, **params)
+    finally:
+        if trace:
+            tracing.stop_trace()
+        if profiler:
+            profiler.stop()
+    return {"cars": result["cars"], "errors": len(result["errors"])}
+
+def worker_main(queue_path=QUEUE_PATH, caps=ENGINE_JOB_CAPS):
+    """Worker process loop: claim a job, run it with a heartbeat, record the outcome"""
+    import browser_pool
+    import scraper_aws as scraper
+
+    # SIGTERM unwinds the running job so its browsers are quit and it is re-queued
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    metrics.init()
+    pid = os.getpid()
+    jobs = JobQueue(queue_path)
+    browser_pool.start_pool(scraper.setup_driver, size=WORKER_POOL_SIZE, warm=WORKER_POOL_WARM,
+                            max_lease_seconds=scraper.MAX_LEASE_SECONDS)
+    logging.info(f"Job worker {pid} started")
+
+    job = None
+    try:
+        while True:
+            job = jobs.claim(pid, caps)
+            if job is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            logging.info(f"Worker {pid} running job {job['id']} (attempt {job['attempts']})")
+            stop_heartbeat = threading.Event()
+            job_progress = progress.JobProgress(job["params"]["start_page"], job["params"]["end_page"])
+
+            def beat(job_id=job["id"]):
+                while not stop_heartbeat.wait(HEARTBEAT_INTERVAL):
+                    jobs.heartbeat(job_id, job_progress.snapshot())
+
+            heartbeat = threading.Thread(target=beat, daemon=True)
+            heartbeat.start()
+            result, error = None, None
+            try:
+                result = run_job(job["id"], job["params"], job_progress)
+            except Exception as e:
+                error = str(e)[:500]
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+
+            jobs.finish(job["id"], result=result, error=error, progress=job_progress.snapshot())
+            if error:
+                logging.error(f"Job {job['id']} failed: {error}")
+            else:
+                logging.info(f"Job {job['id']} done")
+            job = None
+    finally:
+        if job is not None:
+            jobs.requeue(job["id"])
+            logging.info(f"Worker {pid} stopping; job {job['id']} re-queued")
+        browser_pool.shutdown_pool()
+        jobs.close()
+
+class WorkerSupervisor:
+    """Keeps a fixed number of worker processes alive in the API process
+
+    Workers are spawned (not forked) so they do not inherit the server's
+    event loop and threads. A worker that exits is replaced and its job
+    recovered.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, queue_path=QUEUE_PATH, caps=ENGINE_JOB_CAPS):
+        self.workers = workers
+        self.queue_path = queue_path
+        self.caps = caps
+        self.queue = JobQueue(queue_path)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _spawn(self):
+        proc = self._ctx.Process(target=worker_main, args=(self.queue_path, self.caps), daemon=False)
+        proc.start()
+        return proc
+
+    def start(self):
+        # Anything still "running" was owned by the previous server instance
+        self.queue.recover(heartbeat_timeout=0)
+        self._procs = [self._spawn() for _ in range(self.workers)]
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        self._thread.start()
+        logging.info(f"Started {self.workers} job workers")
+        return self
+
+    def _supervise(self):
+        while not self._stop.wait(SUPERVISE_INTERVAL):
+            dead = [p for p in self._procs if not p.is_alive()]
+            if dead:
+                for proc in dead:
+                    logging.warning(f"Job worker {proc.pid} exited with code {proc.exitcode}; restarting")
+                    metrics.mark_process_dead(proc.pid)
+                self._procs = [p for p in self._procs if p.is_alive()]
+            self.queue.recover(dead_pids=[p.pid for p in dead])
+            if not self._stop.is_set():
+                self._procs += [self._spawn() for _ in dead]
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "alive": sum(p.is_alive() for p in self._procs),
+            "jobs": self.queue.counts(),
+        }
+
+    def stop(self, timeout=60):
+        """Ask workers to stop; their running jobs go back to the queue"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        for proc in self._procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in self._procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.kill()
+        self.queue.recover(dead_pids=[p.pid for p in self._procs])
+        for proc in self._procs:
+            metrics.mark_process_dead(proc.pid)
+        self.queue.close()
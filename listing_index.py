@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import records
+
+INDEX_PATH = os.environ.get("LISTING_INDEX_PATH", "/opt/cars-scraper/listing_index.db")
+DEFAULT_TTL_HOURS = 24
+# Each listing's TTL is shortened by a fixed fraction of up to this much,
+# taken from a hash of its id. Listings first scraped in the same run then
+# expire over several later runs instead of all being re-scraped in one.
+TTL_SPREAD = 0.5
+
+# Fields that change on every scrape and must not affect the content hash
+VOLATILE_FIELDS = ("last_updated", "status_flag")
+
+def ttl_factor(car_id, spread=TTL_SPREAD):
+    """Fraction of the TTL that applies to car_id, between 1 - spread and 1"""
+    bucket = int(hashlib.sha1(str(car_id).encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return 1 - spread * bucket
+
+def content_hash(car_data):
+    stable = {k: v for k, v in records.as_dict(car_data).items() if k not in VOLATILE_FIELDS}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class ListingIndex:
+    """Local record of every listing we have scraped, keyed by vehicledetail id
+
+    Stores the price and mileage shown on the results card at the time of the
+    last detail scrape, so a later results page can tell whether a listing
+    changed without opening its detail page.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                id TEXT PRIMARY KEY,
+                card_price INTEGER,
+                card_mileage INTEGER,
+                price TEXT,
+                mileage INTEGER,
+                content_hash TEXT,
+                last_scraped REAL,
+                last_seen REAL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, car_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT card_price, card_mileage, price, mileage, content_hash, last_scraped, last_seen "
+                "FROM listings WHERE id = ?", (car_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("card_price", "card_mileage", "price", "mileage", "content_hash", "last_scraped", "last_seen")
+        return dict(zip(keys, row))
+
+    def is_fresh(self, car_id, card_price, card_mileage, ttl_hours=DEFAULT_TTL_HOURS):
+        """True when the card matches the last scrape and it is within the listing's TTL (see TTL_SPREAD)"""
+        entry = self.get(car_id)
+        if entry is None or entry["last_scraped"] is None:
+            return False
+        if time.time() - entry["last_scraped"] > ttl_hours * 3600 * ttl_factor(car_id):
+            return False
+        if card_price is None or card_price != entry["card_price"]:
+            return False
+        if card_mileage is not None and entry["card_mileage"] is not None and card_mileage != entry["card_mileage"]:
+            return False
+        return True
+
+    def touch(self, car_ids):
+        """Mark listings as seen on a results page without re-scraping them"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE listings SET last_seen = ? WHERE id = ?", [(now, i) for i in car_ids])
+            self._conn.commit()
+
+    def record(self, records, cards=None):
+        """Store freshly scraped (and uploaded) records with their card data"""
+        cards = cards or {}
+        now = time.time()
+        rows = []
+        for car in records:
+            card = cards.get(car["id"]) or {}
+            mileage = car.get("mileage")
+            rows.append((
+                car["id"],
+                card.get("price"),
+                card.get("mileage"),
+                None if car.get("price") is None else str(car.get("price")),
+                mileage if isinstance(mileage, int) else None,
+                content_hash(car),
+                now,
+                now,
+            ))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO listings "
+                "(id, card_price, card_mileage, price, mileage, content_hash, last_scraped, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
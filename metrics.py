@@ -0,0 +1,159 @@
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+import tracing
+
+# Scrapes run in job worker processes while /metrics is served by the API
+# process, so every process writes its samples to a shared directory.
+# prometheus_client picks multiprocess storage when it is imported, so it is
+# only imported, and the metrics below only defined, by init(); the server
+# and job worker entry points call it before any metric is recorded.
+DEFAULT_METRICS_DIR = "/opt/cars-scraper/metrics"
+METRICS_DIR = None   # set by init()
+
+METRIC_NAMES = ("STAGE_SECONDS", "SECTION_SECONDS", "UPLOAD_SECONDS", "UPLOAD_BYTES", "RETRIES", "THROTTLED",
+                "CONCURRENCY_LIMIT", "DRIVER_RESTARTS", "POOL_DRIVERS")
+
+_init_lock = threading.Lock()
+
+# Page loads and settles take seconds; extraction sections take milliseconds
+PAGE_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 12, 20, 30, 60)
+SECTION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 131072, 262144, 524288, 1048576, 4194304)
+
+def init(reset=False):
+    """Set up the shared sample directory and define the metrics; later calls do nothing
+
+    With reset, samples left by an earlier server run are deleted first;
+    only the server passes it, at startup before it spawns any worker (a
+    reset after a metric was already recorded in this process is skipped).
+    """
+    global METRICS_DIR
+    with _init_lock:
+        if METRICS_DIR is not None:
+            return
+        path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", DEFAULT_METRICS_DIR)
+        if reset:
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        globals().update(_define())
+        METRICS_DIR = path
+
+def _define():
+    from prometheus_client import Counter, Gauge, Histogram
+
+    STAGE_SECONDS = Histogram(
+        "scraper_stage_seconds",
+        "Time spent in each scrape stage (results_page_load, cards_settle, detail_page_load, detail_page_fetch)",
+        ["stage"],
+        buckets=PAGE_BUCKETS
+    )
+    SECTION_SECONDS = Histogram(
+        "scraper_extraction_section_seconds",
+        "Time spent extracting each section of a detail page",
+        ["mode", "section"],
+        buckets=SECTION_BUCKETS
+    )
+    UPLOAD_SECONDS = Histogram(
+        "scraper_wordpress_upload_seconds",
+        "Latency of WordPress bulk update requests",
+        ["format"],
+        buckets=PAGE_BUCKETS
+    )
+    UPLOAD_BYTES = Histogram(
+        "scraper_wordpress_upload_bytes",
+        "Request body size of WordPress bulk updates, after compression",
+        ["format"],
+        buckets=BYTES_BUCKETS
+    )
+    RETRIES = Counter(
+        "scraper_retries_total",
+        "Retried operations",
+        ["operation"]
+    )
+    THROTTLED = Counter(
+        "scraper_throttled_total",
+        "Responses that signalled overload (timeout, 429/503, block page)",
+        ["reason"]
+    )
+    CONCURRENCY_LIMIT = Gauge(
+        "scraper_concurrency_limit",
+        "Adaptive detail-fetch concurrency limit, summed over live processes",
+        multiprocess_mode="livesum"
+    )
+    DRIVER_RESTARTS = Counter(
+        "scraper_driver_restarts_total",
+        "Chrome drivers recycled by the browser pool",
+        ["reason"]
+    )
+    POOL_DRIVERS = Gauge(
+        "scraper_browser_pool_drivers",
+        "Browser pool drivers by state, summed over live processes",
+        ["state"],
+        multiprocess_mode="livesum"
+    )
+    return {name: value for name, value in locals().items() if name in METRIC_NAMES}
+
+def __getattr__(name):
+    # A metric touched before any entry point called init() (a standalone
+    # run) gets the default setup
+    if name in METRIC_NAMES:
+        init()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def observe_stage(stage, seconds):
+    init()
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    tracing.record_span(stage, seconds)
+
+@contextmanager
+def timed(stage, **attributes):
+    """Time a stage into STAGE_SECONDS and, when tracing, a span of the same name"""
+    init()
+    start = time.perf_counter()
+    with tracing.span(stage, **attributes) as span:
+        try:
+            yield span
+        finally:
+            STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+class SectionClock:
+    """Times consecutive extraction sections: lap(name) closes the section
+    that started at the previous lap (or at construction)."""
+
+    def __init__(self, mode):
+        init()
+        self.mode = mode
+        self.last = time.perf_counter()
+
+    def lap(self, section):
+        now = time.perf_counter()
+        SECTION_SECONDS.labels(mode=self.mode, section=section).observe(now - self.last)
+        tracing.record_span(f"section.{section}", now - self.last, mode=self.mode)
+        self.last = now
+
+def observe_sections(mode, timings_ms):
+    """Record per-section timings reported by an injected script, in ms"""
+    init()
+    for section, ms in (timings_ms or {}).items():
+        SECTION_SECONDS.labels(mode=mode, section=section).observe(ms / 1000.0)
+    # The script's sections run back to back inside one call, so they are
+    # attached to the enclosing span rather than recorded as spans of their own
+    tracing.current().set(section_ms={k: round(v, 1) for k, v in (timings_ms or {}).items()})
+
+def mark_process_dead(pid):
+    """Drop live gauges of an exited worker process"""
+    init()
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(pid, METRICS_DIR)
+
+def render():
+    """Exposition text aggregated over every process; returns (body, content_type)"""
+    init()
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=METRICS_DIR)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,235 @@
+import re
+import time
+import queue
+import logging
+import threading
+import urllib.parse
+from functools import lru_cache
+import records
+
+EXCLUDED_SELLERS = ["CarMax", "Carvana"]
+MAX_IMAGES = 7
+
+BATCH_SIZE = 25          # raw records normalized per pass
+MAX_BATCH_DELAY = 0.5    # ...or fewer once the oldest has waited this long
+MAX_PENDING = 200        # put() blocks once this many raw records are waiting
+
+# Compiled once; the old per-field re.sub calls recompiled through the re cache
+_KEY_CHARS = re.compile(r'[^a-z0-9\s]')
+_BREAKDOWN_KEY_CHARS = re.compile(r'[^a-zA-Z0-9\s]')
+_NON_DIGITS = re.compile(r'[^0-9]')
+_MONEY = re.compile(r'\d[\d,]*(?:\.\d+)?')
+_YEAR = re.compile(r'^(?:19|20)\d\d$')
+
+MONEY_KEYWORDS = ('price', 'payment', 'amount', 'paid', 'value')
+
+# Values the old normalization used in place of a missing payment
+_MISSING = frozenset(("Not available", "No breakdown available", ""))
+
+@lru_cache(maxsize=1024)
+def field_key(label):
+    """'Exterior color' -> 'exterior_color'; labels repeat on every page, so cached"""
+    return _KEY_CHARS.sub('', label.strip().lower()).replace(' ', '_')
+
+@lru_cache(maxsize=256)
+def feature_key(label):
+    return label.strip().lower().replace(" ", "_")
+
+@lru_cache(maxsize=256)
+def breakdown_key(label):
+    """Breakdown title -> (key, holds_money)"""
+    key = _BREAKDOWN_KEY_CHARS.sub('', label).strip().lower().replace(' ', '_')
+    return key, any(keyword in key for keyword in MONEY_KEYWORDS)
+
+def to_int(text):
+    """Digits of a count such as '12,345 mi.' as an int"""
+    if text is None or isinstance(text, int):
+        return text
+    digits = _NON_DIGITS.sub('', text)
+    return int(digits) if digits else None
+
+def money(text):
+    """'$24,995' / '$412.50/mo' -> whole dollars as an int (cents are rounded)"""
+    if text is None or isinstance(text, int):
+        return text
+    match = _MONEY.search(text)
+    if not match:
+        return None
+    return int(float(match.group(0).replace(",", "")) + 0.5)
+
+def parse_title(title):
+    """'2020 Honda Civic EX' -> {'year': 2020, 'make': 'Honda', 'model': 'Civic EX'}"""
+    parts = title.split() if title else []
+    if len(parts) > 1 and _YEAR.match(parts[0]):
+        return {"year": int(parts[0]), "make": parts[1], "model": " ".join(parts[2:]) or None}
+    return {"year": None, "make": None, "model": None}
+
+def bodystyle_from_href(href):
+    if not href:
+        return None
+    values = urllib.parse.parse_qs(urllib.parse.urlsplit(href).query).get("bodystyle")
+    return values[0] if values else None
+
+def normalize_record(raw, car_id):
+    """Turn one raw extraction object into a records.CarRecord
+
+    price, mileage, year and start_payment are ints (None when missing);
+    money values in the payment breakdown are ints as well.
+    """
+    seller = raw.get("seller") or ""
+    if any(excluded in seller for excluded in EXCLUDED_SELLERS):
+        return {"id": car_id, "error": "Skipped - excluded seller"}
+
+    title = raw.get("title")
+    car_data = {"id": car_id, "title": title, "price": money(raw.get("price"))}
+    car_data.update(parse_title(title))
+
+    if raw.get("status"):
+        car_data["status"] = raw["status"]
+
+    for label, value in raw.get("basics") or ():
+        key = field_key(label or "")
+        value = (value or "").strip()
+        if key and value:
+            car_data[key] = to_int(value) if key == 'mileage' else value
+
+    for label, items in raw.get("features") or ():
+        category = feature_key(label or "")
+        features = [item.strip() for item in items or () if item and item.strip()]
+        if category and features:
+            car_data[f"features_{category}"] = "; ".join(features)
+
+    if raw.get("additional_features"):
+        car_data["additional_popular_features"] = raw["additional_features"].strip()
+
+    all_features = [item.strip() for item in raw.get("all_features") or () if item and item.strip()]
+    if all_features:
+        car_data["all_features"] = "; ".join(all_features)
+
+    images = []
+    for image in raw.get("images") or ():
+        src = image.get("src")
+        if not src:
+            continue
+        src = src.replace('/small/', '/medium/')
+        images.append(records.Image(src, image.get("modal_src") or src, image.get("alt") or ""))
+        if len(images) == MAX_IMAGES:
+            break
+    car_data["images"] = tuple(images)
+
+    car_data["start_payment"] = money(raw.get("payment_text"))
+
+    breakdown = {}
+    for label, value in raw.get("breakdown") or ():
+        label = (label or "").strip()
+        value = (value or "").strip()
+        if label and value:
+            key, holds_money = breakdown_key(label)
+            breakdown[key] = money(value) if holds_money else value
+    car_data["payment_breakdown"] = breakdown or None
+
+    bodystyle = bodystyle_from_href(raw.get("recall_href"))
+    if bodystyle:
+        car_data["bodystyle"] = bodystyle
+
+    if raw.get("location"):
+        car_data["location"] = raw["location"]
+
+    car_data["last_updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return records.CarRecord.from_fields(car_data)
+
+def retype(car_data):
+    """Turn an already-built car_data dict (webdriver extraction) into a CarRecord"""
+    car_data["price"] = money(car_data.get("price")) if isinstance(car_data.get("price"), str) else car_data.get("price")
+    if isinstance(car_data.get("year"), str):
+        car_data["year"] = int(car_data["year"]) if car_data["year"].isdigit() else None
+    if isinstance(car_data.get("mileage"), str):
+        car_data["mileage"] = to_int(car_data["mileage"])
+    for key in ("start_payment", "payment_breakdown"):
+        if car_data.get(key) in _MISSING:
+            car_data[key] = None
+    return records.CarRecord.from_upload(car_data)
+
+def raw_record(car_id, raw):
+    """What extraction hands to the normalization stage"""
+    return {"id": car_id, "raw": raw}
+
+def finish(record):
+    """Normalize one record from any extraction path"""
+    if "raw" in record:
+        return normalize_record(record["raw"], record["id"])
+    if "error" in record:
+        return record
+    return retype(record)
+
+def normalize_batch(records):
+    return [finish(record) for record in records]
+
+class NormalizationStage:
+    """Normalizes extraction results in batches on its own thread
+
+    Detail workers put() raw records and go straight back to the browser;
+    this stage normalizes them and calls on_record(link, car_data) for each
+    result, or on_error(link, error) for records normalization rejects
+    (e.g. excluded sellers).
+    """
+
+    def __init__(self, on_record, on_error=None, batch_size=BATCH_SIZE, max_delay=MAX_BATCH_DELAY,
+                 max_pending=MAX_PENDING):
+        self.on_record = on_record
+        self.on_error = on_error
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        # Bounded so a stalled upload backlog pushes back on the detail workers
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, link, record):
+        self._queue.put((link, record))
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = []
+            item = self._queue.get()
+            deadline = time.time() + self.max_delay
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+            else:
+                closing = True
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch):
+        try:
+            results = normalize_batch([record for _, record in batch])
+        except Exception:
+            # One bad record must not take its batch down with it
+            results = []
+            for _, record in batch:
+                try:
+                    results.append(finish(record))
+                except Exception as e:
+                    results.append({"id": record.get("id"), "error": f"Normalization failed: {e}"})
+
+        for (link, _), car_data in zip(batch, results):
+            try:
+                if "error" in car_data:
+                    if self.on_error:
+                        self.on_error(link, car_data["error"])
+                else:
+                    self.on_record(link, car_data)
+            except Exception as e:
+                logging.error(f"Error handling normalized record for {link}: {e}")
+
+    def close(self):
+        """Normalize everything still queued and stop"""
+        self._queue.put(None)
+        self._thread.join()
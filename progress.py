@@ -0,0 +1,88 @@
+import time
+import threading
+
+class JobProgress:
+    """Live counters for one scrape job, with derived throughput and ETA
+
+    Updated from the producer and detail workers; snapshot() is what
+    /tasks/{task_id} and its event stream report.
+    """
+
+    def __init__(self, start_page=1, end_page=1):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.start_page = start_page
+        self.pages_total = end_page - start_page + 1
+        self.pages_done = 0
+        self.links_found = 0
+        self.cars_scraped = 0
+        self.cars_skipped = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.stage = "running"
+
+    def page_done(self, links):
+        with self._lock:
+            self.pages_done += 1
+            self.links_found += links
+
+    def resumed(self, pages, links):
+        """Pages and still-pending links carried over from a checkpoint"""
+        with self._lock:
+            self.pages_done += pages
+            self.links_found += links
+
+    def sharded(self, searches):
+        """The job walks its page range once for each of this many shard searches"""
+        with self._lock:
+            self.pages_total *= searches
+
+    def results_end(self, pages):
+        """A search ran out before end_page; this many of its pages will not be walked"""
+        with self._lock:
+            self.pages_total = max(self.pages_total - pages, self.pages_done)
+
+    def car_done(self, latency, ok=True):
+        with self._lock:
+            if ok:
+                self.cars_scraped += 1
+            else:
+                self.errors += 1
+            self.latency_total += latency
+
+    def car_skipped(self):
+        with self._lock:
+            self.cars_skipped += 1
+
+    def set_stage(self, stage):
+        with self._lock:
+            self.stage = stage
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-6)
+            processed = self.cars_scraped + self.errors
+            remaining = max(self.links_found - processed - self.cars_skipped, 0)
+            cars_per_min = self.cars_scraped * 60 / elapsed
+            eta = None
+            if processed and self.stage != "done":
+                # Links still arriving from unwalked pages are estimated from
+                # the average page so far
+                if self.pages_done and self.pages_done < self.pages_total:
+                    per_page = self.links_found / self.pages_done
+                    remaining += per_page * (self.pages_total - self.pages_done)
+                eta = round(remaining / (processed / elapsed), 1)
+            return {
+                "stage": self.stage,
+                "elapsed_seconds": round(elapsed, 1),
+                "pages_total": self.pages_total,
+                "pages_done": self.pages_done,
+                "links_found": self.links_found,
+                "cars_scraped": self.cars_scraped,
+                "cars_skipped": self.cars_skipped,
+                "errors": self.errors,
+                "pages_per_sec": round(self.pages_done / elapsed, 3),
+                "cars_per_min": round(cars_per_min, 2),
+                "avg_car_latency_seconds": round(self.latency_total / processed, 2) if processed else None,
+                "eta_seconds": eta,
+            }
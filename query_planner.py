@@ -0,0 +1,110 @@
+import time
+import logging
+
+# Ways a search can be split into disjoint sub-searches (shards); each maps
+# onto filters build_url already sends. cars.com has no minimum distance,
+# so zip/distance rings cannot be expressed as disjoint queries.
+SHARD_DIMENSIONS = ("price", "year", "make")
+MAX_SHARDS = 16
+
+# Band edges in dollars, roughly equal slices of used inventory; the top
+# band is open-ended unless the request sets list_price_max
+PRICE_BREAKS = (5000, 8000, 10000, 12000, 14000, 16000, 18000, 20000, 22500, 25000,
+                27500, 30000, 35000, 40000, 50000, 65000, 80000)
+# Model years before this go into the oldest (open-ended) band
+YEAR_FLOOR = 2000
+
+# Checkpoint page keys: shard s, page p is stored as s * SHARD_PAGE_STRIDE + p,
+# so an unsharded job keeps plain page numbers
+SHARD_PAGE_STRIDE = 10000
+
+def page_key(shard, page):
+    return shard * SHARD_PAGE_STRIDE + page
+
+def pick(candidates, count):
+    """count values spread evenly across the sorted candidates"""
+    if count <= 0 or not candidates:
+        return []
+    if count >= len(candidates):
+        return list(candidates)
+    step = len(candidates) / (count + 1)
+    return sorted({candidates[int(step * (i + 1))] for i in range(count)})
+
+def split_range(low, high, breaks, shards):
+    """Disjoint inclusive integer ranges covering low..high (None = unbounded)
+
+    Cut points come from breaks where possible, or equal widths when the
+    range is bounded and too narrow for the preset breaks.
+    """
+    floor = low if low is not None else float("-inf")
+    ceiling = high if high is not None else float("inf")
+    inner = [b for b in breaks if floor < b <= ceiling]
+    if len(inner) < shards - 1 and low is not None and high is not None:
+        width = (high - low + 1) / shards
+        inner = sorted({low + int(width * i) for i in range(1, shards)} - {low})
+    cuts = pick(inner, shards - 1)
+    edges = [low] + cuts
+    return [(start, (edges[i + 1] - 1) if i + 1 < len(edges) else high) for i, start in enumerate(edges)]
+
+def split_makes(makes, models, shards):
+    """Groups of makes, each with the models that belong to them"""
+    groups = [makes[i::shards] for i in range(min(shards, len(makes)))]
+    result = []
+    for group in groups:
+        prefixes = tuple(f"{make}-" for make in group)
+        # Model slugs are "<make>-<model>"; keep unrecognized ones everywhere
+        owned = [m for m in models if m.startswith(prefixes)
+                 or not any(m.startswith(f"{make}-") for make in makes)]
+        result.append((group, owned))
+    return result
+
+def has_price_range(filters):
+    return filters.get("list_price_min") is not None or filters.get("list_price_max") is not None
+
+def choose_dimension(filters):
+    if len(filters.get("makes") or []) > 1:
+        return "make"
+    # Every price band sets a price filter, which drops listings without a
+    # price; that is only safe when the search already filters on price
+    if has_price_range(filters):
+        return "price"
+    return "year"
+
+def plan_shards(filters, shards=1, shard_by=None):
+    """Split one search into up to shards disjoint searches covering the same listings
+
+    Returns a list of filter dicts for build_url; a single-element list
+    (the filters unchanged) when shards is 1 or the search cannot be split.
+
+    Price shards only cover listings that have a price, since every band
+    is sent as a price filter. They are therefore used only when the
+    search sets list_price_min or list_price_max (which excludes unpriced
+    listings already); otherwise a price request is split by year instead.
+    Year and make shards cover every listing the search matches.
+    """
+    shards = max(1, min(int(shards or 1), MAX_SHARDS))
+    if shards == 1:
+        return [filters]
+    shard_by = shard_by or choose_dimension(filters)
+    if shard_by not in SHARD_DIMENSIONS:
+        raise ValueError(f"Unknown shard dimension {shard_by!r}; expected one of {SHARD_DIMENSIONS}")
+
+    if shard_by == "make":
+        if len(filters.get("makes") or []) < 2:
+            return [filters]
+        return [dict(filters, makes=group, models=owned)
+                for group, owned in split_makes(filters["makes"], filters.get("models") or [], shards)]
+
+    if shard_by == "price" and not has_price_range(filters):
+        logging.warning("Price shards would drop listings without a price; sharding by year instead")
+        shard_by = "year"
+
+    if shard_by == "price":
+        bands = split_range(filters.get("list_price_min"), filters.get("list_price_max"), PRICE_BREAKS, shards)
+        return [dict(filters, list_price_min=low, list_price_max=high) for low, high in bands]
+
+    this_year = time.localtime().tm_year + 1
+    years = range(max(YEAR_FLOOR, (filters.get("year_min") or YEAR_FLOOR) + 1),
+                  min(this_year, filters.get("year_max") or this_year) + 1)
+    bands = split_range(filters.get("year_min"), filters.get("year_max"), tuple(years), shards)
+    return [dict(filters, year_min=low, year_max=high) for low, high in bands]
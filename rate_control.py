@@ -0,0 +1,335 @@
+import os
+import re
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+import contextvars
+import urllib.parse
+from contextlib import contextmanager, asynccontextmanager
+import metrics
+
+# Requests per second allowed to one host, shared by every worker process,
+# and how many may go out back to back; 0 disables the limit
+RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH", "/opt/cars-scraper/rate_limit.db")
+HOST_RATE_LIMIT = float(os.environ.get("HOST_RATE_LIMIT", "20"))
+HOST_BURST = int(os.environ.get("HOST_BURST", "40"))
+# Each process takes tokens from the shared bucket this many seconds' worth at a time
+SYNC_SECONDS = 0.5
+# A block page or a 429 without Retry-After stops the host for this long
+THROTTLE_PAUSE_SECONDS = 10.0
+
+# AIMD: the limit grows by INCREASE_STEP after each healthy window of
+# WINDOW completions and is cut by DECREASE_FACTOR on overload, at most
+# once per COOLDOWN_SECONDS
+MIN_CONCURRENCY = 1
+WINDOW = 20
+INCREASE_STEP = int(os.environ.get("ADAPTIVE_INCREASE_STEP", "1"))
+DECREASE_FACTOR = 0.5
+COOLDOWN_SECONDS = 5.0
+MAX_ERROR_RATE = 0.1
+# A window whose mean latency exceeds the baseline by this factor counts as overload
+LATENCY_TOLERANCE = 2.0
+# How fast the baseline follows latency upwards (it follows it down at once)
+BASELINE_DRIFT = 0.1
+
+BACKOFF_CAP_SECONDS = 30.0
+
+# Titles of interstitials served instead of the page when we are being blocked
+BLOCK_TITLES = ("access denied", "just a moment", "attention required", "pardon our interruption",
+                "are you a robot", "captcha", "request unsuccessful")
+_TITLE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+_current = contextvars.ContextVar("adaptive_concurrency", default=None)
+
+def backoff(attempt, base=1.0, cap=BACKOFF_CAP_SECONDS):
+    """Seconds to wait before retry attempt + 1: exponential, capped, with jitter"""
+    delay = min(cap, base * 2 ** attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+def is_block_page(title):
+    title = (title or "").strip().lower()
+    return any(marker in title for marker in BLOCK_TITLES)
+
+def page_title(page_html):
+    match = _TITLE.search(page_html[:20000]) if page_html else None
+    return match.group(1) if match else ""
+
+def retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds form only)"""
+    try:
+        return min(float(value), BACKOFF_CAP_SECONDS * 4)
+    except (TypeError, ValueError):
+        return None
+
+def host_of(url):
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+class HostBudget:
+    """Token bucket per host, shared by every worker process through SQLite
+
+    The shared state is a GCRA theoretical arrival time: each request moves
+    it 1/rate seconds forward, and a request may go once it is no more than
+    burst requests ahead of now. A process takes tokens from it in batches
+    of about SYNC_SECONDS worth of traffic and hands them out in memory, so
+    only one request in a batch touches the database.
+    """
+
+    def __init__(self, path=RATE_LIMIT_PATH, rate=HOST_RATE_LIMIT, burst=HOST_BURST, sync_seconds=SYNC_SECONDS):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.tolerance = self.interval * max(burst - 1, 0)
+        self.batch = max(1, min(burst, int(rate * sync_seconds)))
+        self._local = {}   # host -> [tokens left, send time of the next one]
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._conn = None
+        if self.interval:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, tat REAL)")
+
+    def _update(self, host, advance):
+        """Apply advance(tat, now) -> (new_tat, result) atomically"""
+        with self._db_lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tat FROM hosts WHERE host = ?", (host,)).fetchone()
+                tat, result = advance(row[0] if row else now, now)
+                self._conn.execute("INSERT OR REPLACE INTO hosts (host, tat) VALUES (?, ?)", (host, tat))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return result
+
+    def take(self, host):
+        """Seconds to wait before sending, from this process's tokens; None when it has none left"""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            local = self._local.get(host)
+            if not local or local[0] <= 0:
+                return None
+            local[0] -= 1
+            send_at, local[1] = local[1], local[1] + self.interval
+            return max(0.0, send_at - time.time())
+
+    def refill(self, host):
+        """Take the next batch of tokens for host from the shared bucket"""
+        with self._refill_lock:
+            with self._lock:
+                local = self._local.get(host)
+                if local and local[0] > 0:
+                    # Another caller refilled while we waited
+                    return
+            # Token i of the batch may go when GCRA would have let it: start + i * interval
+            send_at = self._update(host, lambda tat, now: (
+                max(tat, now) + self.interval * self.batch, max(tat, now) - self.tolerance
+            ))
+            with self._lock:
+                self._local[host] = [self.batch, send_at]
+
+    def reserve(self, host):
+        """Take one request slot for host; returns seconds to wait before sending"""
+        delay = self.take(host)
+        while delay is None:
+            self.refill(host)
+            delay = self.take(host)
+        return delay
+
+    def pause(self, host, seconds):
+        """Let no request to host go out for the next seconds"""
+        if not self.interval:
+            return
+        with self._lock:
+            # Tokens already taken are dropped so the next request resyncs
+            self._local.pop(host, None)
+        self._update(host, lambda tat, now: (max(tat, now + seconds + self.tolerance), None))
+
+_budget = None
+_budget_lock = threading.Lock()
+
+def budget():
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = HostBudget()
+        return _budget
+
+def wait_turn(url):
+    """Block until the host's rate limit lets a request to url go out"""
+    delay = budget().reserve(host_of(url))
+    if delay:
+        time.sleep(delay)
+
+async def wait_turn_async(url):
+    host = host_of(url)
+    limits = budget()
+    delay = limits.take(host)
+    while delay is None:
+        # Refilling waits on the shared database; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, limits.refill, host)
+        delay = limits.take(host)
+    if delay:
+        await asyncio.sleep(delay)
+
+def throttled(url, reason, pause=None):
+    """Report an overload signal from a request to url
+
+    Cuts the calling job's concurrency (when the request runs inside one of
+    its slots) and, with pause, holds back every process's requests to the host.
+    """
+    metrics.THROTTLED.labels(reason=reason).inc()
+    if pause:
+        logging.warning(f"{host_of(url)} throttled us ({reason}); pausing requests for {pause:.0f}s")
+        budget().pause(host_of(url), pause)
+    limiter = _current.get()
+    if limiter is not None:
+        limiter.decrease(reason)
+
+def overloaded(url, status, page_html=None, retry_after_header=None):
+    """Report and return True when a response means the host is pushing back"""
+    if status == 429:
+        throttled(url, "http_429", pause=retry_after(retry_after_header) or THROTTLE_PAUSE_SECONDS)
+        return True
+    if status == 503:
+        # Often a transient upstream error; only pause when the host asks us to
+        throttled(url, "http_503", pause=retry_after(retry_after_header))
+        return True
+    if status in (200, 403) and is_block_page(page_title(page_html)):
+        throttled(url, "block_page", pause=THROTTLE_PAUSE_SECONDS)
+        return True
+    return False
+
+class Slot:
+    """One admitted request; set ok = False when it failed"""
+
+    __slots__ = ("ok",)
+
+    def __init__(self):
+        self.ok = True
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit for one job's detail fetches
+
+    Starts at half of maximum and admits at most limit requests at a time.
+    Healthy windows (few errors, latency near the best seen) raise the
+    limit additively; overload signals from throttled() and unhealthy
+    windows halve it. Use either slot() (threads) or async_slot() (one
+    event loop) on an instance, not both.
+    """
+
+    def __init__(self, maximum, initial=None, minimum=MIN_CONCURRENCY, window=WINDOW):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = max(self.minimum, min(initial or self.maximum // 2, self.maximum))
+        self.window = window
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._async_cond = None
+        self._latencies = []
+        self._failures = 0
+        self._baseline = None
+        self._last_decrease = 0.0
+        metrics.CONCURRENCY_LIMIT.inc(self.limit)
+
+    def _set_limit(self, limit):
+        metrics.CONCURRENCY_LIMIT.inc(limit - self.limit)
+        self.limit = limit
+
+    def _record(self, latency, ok):
+        """Add one completion; returns True when the limit went up"""
+        with self._cond:
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self._failures += 1
+            completed = len(self._latencies) + self._failures
+            if completed < self.window:
+                return False
+            error_rate = self._failures / completed
+            mean = sum(self._latencies) / len(self._latencies) if self._latencies else None
+            self._latencies = []
+            self._failures = 0
+            if mean is not None:
+                if self._baseline is None or mean < self._baseline:
+                    self._baseline = mean
+                else:
+                    self._baseline += (mean - self._baseline) * BASELINE_DRIFT
+            if error_rate > MAX_ERROR_RATE:
+                reason = "errors"
+            elif mean is not None and mean > self._baseline * LATENCY_TOLERANCE:
+                reason = "latency"
+            else:
+                if self.limit >= self.maximum:
+                    return False
+                self._set_limit(min(self.maximum, self.limit + INCREASE_STEP))
+                self._cond.notify_all()
+                return True
+        self.decrease(reason)
+        return False
+
+    def decrease(self, reason):
+        with self._cond:
+            now = time.time()
+            if now - self._last_decrease < COOLDOWN_SECONDS or self.limit <= self.minimum:
+                return
+            self._last_decrease = now
+            self._latencies = []
+            self._failures = 0
+            previous = self.limit
+            self._set_limit(max(self.minimum, int(self.limit * DECREASE_FACTOR)))
+        logging.info(f"Concurrency {previous} -> {self.limit} ({reason})")
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._in_use < self.limit)
+            self._in_use += 1
+        slot = Slot()
+        token = _current.set(self)
+        started = time.time()
+        try:
+            yield slot
+        except BaseException:
+            slot.ok = False
+            raise
+        finally:
+            _current.reset(token)
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            self._record(time.time() - started, slot.ok)
+
+    @asynccontextmanager
+    async def async_slot(self):
+        if self._async_cond is None:
+            self._async_cond = asyncio.Condition()
+        async with self._async_cond:
+            await self._async_cond.wait_for(lambda: self._in_use < self.limit)
+            self._in_use += 1
+        slot = Slot()
+        token = _current.set(self)
+        started = time.time()
+        try:
+            yield slot
+        except BaseException:
+            slot.ok = False
+            raise
+        finally:
+            _current.reset(token)
+            self._in_use -= 1
+            raised = self._record(time.time() - started, slot.ok)
+            async with self._async_cond:
+                if raised:
+                    self._async_cond.notify_all()
+                else:
+                    self._async_cond.notify()
+
+    def close(self):
+        metrics.CONCURRENCY_LIMIT.dec(self.limit)
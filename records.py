@@ -0,0 +1,131 @@
+import json
+from collections import namedtuple
+from operator import attrgetter
+from json.encoder import encode_basestring_ascii as _encode
+
+# Fields the WordPress cars-scraper/v1 API stores for a car
+FIELDS = [
+    'id', 'title', 'price', 'mileage', 'exterior_color', 'interior_color',
+    'engine', 'transmission', 'drivetrain', 'fuel_type', 'mpg', 'vin',
+    'stock_', 'features_exterior', 'features_seating', 'features_safety',
+    'features_convenience', 'features_entertainment',
+    'additional_popular_features', 'all_features', 'images',
+    'start_payment', 'payment_breakdown', 'status_flag',
+    'make', 'model', 'status', 'year',
+    'bodystyle', 'location'
+]
+
+INT_FIELDS = ('price', 'mileage', 'year', 'start_payment')
+NESTED_FIELDS = ('images', 'payment_breakdown')
+# Sent even when empty so WordPress clears a value that went away
+ALWAYS_SENT = frozenset(('id', 'title', 'price', 'year', 'make', 'model', 'start_payment', 'payment_breakdown'))
+# Kept on the record but never uploaded
+LOCAL_FIELDS = ('last_updated',)
+
+# Low-cardinality values repeated across thousands of cars in a job; each
+# distinct value is stored once per process
+SHARED_FIELDS = frozenset((
+    'exterior_color', 'interior_color', 'engine', 'transmission', 'drivetrain', 'fuel_type', 'mpg',
+    'make', 'model', 'status', 'bodystyle', 'location'
+))
+MAX_SHARED_VALUES = 50000
+
+Image = namedtuple("Image", ("src", "modal_src", "alt"))
+
+_shared_values = {}
+
+def shared(value):
+    """One copy of a repeated string (a bounded, clearable alternative to sys.intern)"""
+    if len(_shared_values) >= MAX_SHARED_VALUES:
+        _shared_values.clear()
+    return _shared_values.setdefault(value, value)
+
+def encode_images(images):
+    """json.dumps of the image dicts, byte for byte, without building the dicts"""
+    return "[" + ", ".join(
+        f'{{"src": {_encode(src)}, "modal_src": {_encode(modal_src)}, "alt": {_encode(alt)}}}'
+        for src, modal_src, alt in images
+    ) + "]"
+
+_SCALAR_FIELDS = tuple(f for f in FIELDS if f not in NESTED_FIELDS)
+_get_scalars = attrgetter(*_SCALAR_FIELDS)
+
+class CarRecord:
+    """One scraped car, holding exactly the fields WordPress stores
+
+    Numbers are ints, images is a tuple of Image and payment_breakdown a
+    dict; to_upload() turns the record into the API payload. Read access
+    mirrors a dict (record["id"], record.get("price")) so code that handles
+    both records and spooled dicts needs no special case.
+    """
+
+    __slots__ = tuple(FIELDS) + LOCAL_FIELDS
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            value = fields.get(name)
+            if value.__class__ is str and name in SHARED_FIELDS:
+                value = shared(value)
+            setattr(self, name, value)
+
+    @classmethod
+    def from_fields(cls, fields):
+        """Build from a field dict, ignoring keys WordPress does not store"""
+        return cls(**{k: v for k, v in fields.items() if k in _SLOTS})
+
+    @classmethod
+    def from_upload(cls, data):
+        """Rebuild a record from its to_upload() form (checkpoints, spooled batches)"""
+        record = cls.from_fields(data)
+        images = record.images
+        if isinstance(images, str):
+            images = json.loads(images)
+        if images:
+            record.images = tuple(Image(i.get("src"), i.get("modal_src"), i.get("alt") or "") for i in images)
+        breakdown = record.payment_breakdown
+        if isinstance(breakdown, str):
+            record.payment_breakdown = json.loads(breakdown) if breakdown.startswith("{") else None
+        return record
+
+    def to_upload(self, encode_nested=True):
+        """The API payload; nested values are JSON strings unless encode_nested is False"""
+        data = {
+            name: value
+            for name, value in zip(_SCALAR_FIELDS, _get_scalars(self))
+            if value is not None or name in ALWAYS_SENT
+        }
+        if self.images:
+            if encode_nested:
+                data["images"] = encode_images(self.images)
+            else:
+                data["images"] = [image._asdict() for image in self.images]
+        breakdown = self.payment_breakdown or None
+        data["payment_breakdown"] = json.dumps(breakdown) if encode_nested and breakdown else breakdown
+        return data
+
+    def __getitem__(self, name):
+        if name not in _SLOTS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None) if name in _SLOTS else None
+        return default if value is None else value
+
+    def __contains__(self, name):
+        return name in _SLOTS and getattr(self, name) is not None
+
+    def __repr__(self):
+        return f"CarRecord(id={self.id!r}, title={self.title!r})"
+
+_SLOTS = frozenset(CarRecord.__slots__)
+
+def as_dict(car, encode_nested=True):
+    """Upload form of a record; dicts (e.g. from a spool file) pass through"""
+    return car.to_upload(encode_nested) if isinstance(car, CarRecord) else car
+
+def json_default(obj):
+    """json.dumps default= that writes records in their upload form"""
+    if isinstance(obj, CarRecord):
+        return obj.to_upload()
+    return str(obj)
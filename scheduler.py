@@ -0,0 +1,228 @@
+import os
+import json
+import math
+import time
+import uuid
+import random
+import sqlite3
+import logging
+import threading
+import job_queue
+
+SCHEDULE_PATH = os.environ.get("SCHEDULE_PATH", "/opt/cars-scraper/schedules.db")
+TICK_SECONDS = 15
+# Scheduled jobs run one after another (at most this many queued or running
+# at once), and launches are at least STAGGER_SECONDS apart, so profiles
+# that fall due together are spread out instead of landing at once
+MAX_ACTIVE_RUNS = int(os.environ.get("SCHEDULER_MAX_ACTIVE_RUNS", "1"))
+STAGGER_SECONDS = float(os.environ.get("SCHEDULER_STAGGER_SECONDS", "60"))
+MIN_INTERVAL_SECONDS = 300
+def parse_start_at(start_at, now=None):
+    """'HH:MM' (server local time) -> timestamp of its next occurrence"""
+    hours, minutes = (int(part) for part in start_at.split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid start_at {start_at!r}; expected HH:MM")
+    now = now or time.time()
+    today = time.localtime(now)
+    anchor = time.mktime((today.tm_year, today.tm_mon, today.tm_mday, hours, minutes, 0, 0, 0, -1))
+    return anchor if anchor >= now else anchor + 86400
+
+def next_slot(anchor, interval, after):
+    """First anchor + k * interval later than after, and how many slots it passed over"""
+    if after < anchor:
+        return anchor, 0
+    passed = math.floor((after - anchor) / interval) + 1
+    return anchor + passed * interval, passed
+
+class Scheduler:
+    """Recurring scrape profiles that enqueue jobs on the durable job queue
+
+    A profile is a set of job params with an interval, optionally anchored
+    to a time of day (start_at) and randomly delayed by up to jitter
+    seconds. Runs never overlap: an occurrence that falls due while the
+    profile's previous job is still queued or running is coalesced into
+    that job, and occurrences missed while the scheduler was down or
+    waiting for capacity collapse into one run.
+    """
+
+    def __init__(self, queue, path=SCHEDULE_PATH, max_active=MAX_ACTIVE_RUNS, stagger_seconds=STAGGER_SECONDS):
+        self.queue = queue
+        self.max_active = max_active
+        self.stagger_seconds = stagger_seconds
+        self._last_launch = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS schedules (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                params TEXT NOT NULL,
+                interval_seconds REAL NOT NULL,
+                jitter_seconds REAL NOT NULL DEFAULT 0,
+                anchor REAL NOT NULL,
+                slot REAL NOT NULL,
+                next_run REAL NOT NULL,
+                enabled INTEGER NOT NULL DEFAULT 1,
+                last_run REAL,
+                last_job_id TEXT,
+                runs INTEGER NOT NULL DEFAULT 0,
+                coalesced INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def add(self, name, engine, params, interval_seconds, jitter_seconds=0, start_at=None, enabled=True):
+        if interval_seconds < MIN_INTERVAL_SECONDS:
+            raise ValueError(f"interval must be at least {MIN_INTERVAL_SECONDS} seconds")
+        now = time.time()
+        anchor = parse_start_at(start_at, now) if start_at else now
+        schedule_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO schedules (id, name, engine, params, interval_seconds, jitter_seconds, anchor, slot, "
+                "next_run, enabled, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (schedule_id, name, engine, json.dumps(params), interval_seconds, jitter_seconds, anchor, anchor,
+                 anchor + random.uniform(0, jitter_seconds), int(enabled), now)
+            )
+        return self.get(schedule_id)
+
+    def set_enabled(self, schedule_id, enabled):
+        """Pause or resume a profile; a resumed profile runs at its next slot, not for the ones it missed"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT anchor, interval_seconds, jitter_seconds FROM schedules WHERE id = ?", (schedule_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            anchor, interval, jitter = row
+            slot, _ = next_slot(anchor, interval, time.time())
+            self._conn.execute(
+                "UPDATE schedules SET enabled = ?, slot = ?, next_run = ? WHERE id = ?",
+                (int(enabled), slot, slot + random.uniform(0, jitter), schedule_id)
+            )
+        return self.get(schedule_id)
+
+    def remove(self, schedule_id):
+        with self._lock:
+            return self._conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,)).rowcount > 0
+
+    def _rows(self, where="", args=()):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, engine, params, interval_seconds, jitter_seconds, anchor, slot, next_run, enabled, "
+                f"last_run, last_job_id, runs, coalesced, created_at FROM schedules {where} ORDER BY next_run", args
+            ).fetchall()
+        keys = ("id", "name", "engine", "params", "interval_seconds", "jitter_seconds", "anchor", "slot",
+                "next_run", "enabled", "last_run", "last_job_id", "runs", "coalesced", "created_at")
+        schedules = []
+        for row in rows:
+            schedule = dict(zip(keys, row))
+            schedule["params"] = json.loads(schedule["params"])
+            schedule["enabled"] = bool(schedule["enabled"])
+            schedules.append(schedule)
+        return schedules
+
+    def get(self, schedule_id):
+        found = self._rows("WHERE id = ?", (schedule_id,))
+        return found[0] if found else None
+
+    def list(self):
+        return self._rows()
+
+    def _active(self, schedule):
+        job = self.queue.get(schedule["last_job_id"]) if schedule["last_job_id"] else None
+        return job is not None and job["status"] in (job_queue.QUEUED, job_queue.RUNNING)
+
+    def _due(self, schedule, now, launch):
+        interval = schedule["interval_seconds"]
+        due = math.floor((now - schedule["slot"]) / interval) + 1
+        # A launched run stands for the first due slot; every other slot it
+        # (or the still-active run) absorbs is counted as coalesced
+        return schedule["slot"] + due * interval, due - 1 if launch else due
+
+    def _advance(self, schedule, now, launch=False):
+        """Move a due profile past now; returns its new next_run, or None if another scheduler got there first"""
+        slot, coalesced = self._due(schedule, now, launch)
+        next_run = slot + random.uniform(0, schedule["jitter_seconds"])
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE schedules SET slot = ?, next_run = ?, coalesced = coalesced + ? WHERE id = ? AND next_run = ?",
+                (slot, next_run, coalesced, schedule["id"], schedule["next_run"])
+            ).rowcount
+        return next_run if updated else None
+
+    def _unclaim(self, schedule, now, next_run):
+        """Undo _advance for a launch that failed, so the occurrence stays due"""
+        _, coalesced = self._due(schedule, now, launch=True)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE schedules SET slot = ?, next_run = ?, coalesced = coalesced - ? WHERE id = ? AND next_run = ?",
+                (schedule["slot"], schedule["next_run"], coalesced, schedule["id"], next_run)
+            )
+
+    def _launched(self, schedule, now, job_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE schedules SET runs = runs + 1, last_run = ?, last_job_id = ? WHERE id = ?",
+                (now, job_id, schedule["id"])
+            )
+
+    def tick(self, now=None):
+        """Launch the profiles that are due and have capacity; returns the new job ids"""
+        now = now or time.time()
+        schedules = self._rows("WHERE enabled = 1")
+        active = sum(self._active(schedule) for schedule in schedules)
+        launched = []
+        for schedule in schedules:
+            if schedule["next_run"] > now:
+                break
+            if self._active(schedule):
+                # The previous run is still going; this occurrence is folded into it
+                if self._advance(schedule, now):
+                    logging.info(f"Schedule {schedule['name']}: previous run still active; occurrence coalesced")
+                continue
+            if active >= self.max_active or now - self._last_launch < self.stagger_seconds:
+                # Stays due; it launches once capacity frees up
+                continue
+            # Claim the occurrence first so no other scheduler launches it too,
+            # but only record the job once it is actually on the queue
+            next_run = self._advance(schedule, now, launch=True)
+            if next_run is None:
+                continue
+            job_id = str(uuid.uuid4())
+            try:
+                self.queue.enqueue(job_id, schedule["engine"], schedule["params"])
+            except Exception as e:
+                logging.error(f"Schedule {schedule['name']}: could not queue job: {e}; retrying next tick")
+                self._unclaim(schedule, now, next_run)
+                continue
+            self._launched(schedule, now, job_id)
+            logging.info(f"Schedule {schedule['name']}: queued job {job_id}")
+            self._last_launch = now
+            active += 1
+            launched.append(job_id)
+        return launched
+
+    def _run(self):
+        while not self._stop.wait(TICK_SECONDS):
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Scheduler tick failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        with self._lock:
+            self._conn.close()
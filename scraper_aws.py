@@ -1,15 +1,32 @@
 import time
 import json
-import re
+import asyncio
+import os
+import fnmatch
+import hashlib
 import logging
+import uuid
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from queue import Queue, Empty
+import threading
 import database as db
+import http_scraper
+import browser_pool
+import listing_index
+import uploader
+import checkpoint
+import metrics
+import tracing
+import normalize
+import frontier
+import query_planner
+import rate_control
 import urllib.parse
 import requests
 
@@ -23,7 +40,66 @@ logging.basicConfig(
     ]
 )
 
-def setup_driver(headless=True):
+IMAGE_URL_PATTERNS = ["*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico"]
+FONT_URL_PATTERNS = ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"]
+MEDIA_URL_PATTERNS = ["*.mp4", "*.webm", "*.m3u8", "*.mp3"]
+STYLESHEET_URL_PATTERNS = ["*.css"]
+TRACKER_URL_PATTERNS = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*googleadservices.com*",
+    "*doubleclick.net*", "*googlesyndication.com*", "*adservice.google.com*",
+    "*facebook.net*", "*facebook.com/tr*", "*connect.facebook.net*",
+    "*amazon-adsystem.com*", "*adsrvr.org*", "*criteo.com*", "*criteo.net*",
+    "*taboola.com*", "*outbrain.com*", "*scorecardresearch.com*", "*quantserve.com*",
+    "*demdex.net*", "*omtrdc.net*", "*hotjar.com*", "*clarity.ms*", "*bat.bing.com*",
+    "*nr-data.net*", "*js-agent.newrelic.com*", "*optimizely.com*", "*segment.io*",
+    "*cdn.segment.com*", "*tiktok.com*", "*ct.pinterest.com*", "*snapchat.com*",
+]
+
+# What each profile keeps Chrome from downloading. Image URLs are still read
+# from the DOM attributes; only the downloads are skipped.
+RESOURCE_BLOCKING_PROFILES = {
+    "none": [],
+    "standard": IMAGE_URL_PATTERNS + FONT_URL_PATTERNS + MEDIA_URL_PATTERNS + TRACKER_URL_PATTERNS,
+    "aggressive": IMAGE_URL_PATTERNS + FONT_URL_PATTERNS + MEDIA_URL_PATTERNS + TRACKER_URL_PATTERNS
+                  + STYLESHEET_URL_PATTERNS,
+}
+DEFAULT_BLOCKING_PROFILE = os.environ.get("RESOURCE_BLOCKING_PROFILE", "standard")
+
+# URLs the payment calculator needs. Network.setBlockedURLs has no allow
+# rules, so any blocking pattern that would also match one of these is dropped.
+RESOURCE_ALLOWLIST = [
+    "https://www.cars.com/*calculator*.js",
+    "https://www.cars.com/*payment*.js",
+    "https://*.cars.com/*financing*",
+]
+
+def blocked_url_patterns(profile=DEFAULT_BLOCKING_PROFILE, allowlist=RESOURCE_ALLOWLIST):
+    """Blocking patterns for a profile with allowlist conflicts removed"""
+    patterns = RESOURCE_BLOCKING_PROFILES[profile]
+    return [
+        pattern for pattern in patterns
+        if not any(fnmatch.fnmatchcase(allowed, pattern) for allowed in allowlist)
+    ]
+
+PAGE_LOAD_TIMEOUT = 45   # seconds for driver.get and async scripts (raised for AWS)
+PAGE_LOAD_RETRIES = 5    # driver.get attempts per load_page_with_retry
+DETAIL_ATTEMPTS = 3      # load-and-extract attempts per detail page
+# Waiting for and reading a detail page's sections
+DETAIL_EXTRACTION_SECONDS = 60
+
+def max_backoff(attempts, base=3):
+    """Longest total rate_control.backoff sleep between attempts tries"""
+    return sum(min(rate_control.BACKOFF_CAP_SECONDS, base * 2 ** a) for a in range(attempts - 1))
+
+# Browser leases held longer than this are force-recycled. It covers one
+# detail attempt whose page loads all time out (about 5.5 minutes), so a
+# slow page keeps its browser through a full round of load retries while a
+# hung browser is still caught. A page still failing after that gets an
+# error result from its next WebDriver call.
+MAX_LEASE_SECONDS = (PAGE_LOAD_RETRIES * PAGE_LOAD_TIMEOUT + max_backoff(PAGE_LOAD_RETRIES)
+                     + DETAIL_EXTRACTION_SECONDS)
+
+def setup_driver(headless=True, blocking_profile=DEFAULT_BLOCKING_PROFILE):
     """AWS-optimized Chrome driver setup"""
     options = Options()
     options.add_argument("--headless=new")
@@ -72,28 +148,46 @@ def setup_driver(headless=True):
     options.add_argument("--disable-features=TranslateUI")
     options.add_argument("--disable-ipc-flooding-protection")
     
+    # Return from driver.get() at DOMContentLoaded; extraction waits for
+    # the elements it needs itself.
+    options.page_load_strategy = "eager"
+    blocked_patterns = blocked_url_patterns(blocking_profile)
+    if any(pattern in blocked_patterns for pattern in IMAGE_URL_PATTERNS):
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    
     driver = webdriver.Chrome(options=options)
-    driver.set_page_load_timeout(45)  # Increased for AWS
-    driver.set_script_timeout(45)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    driver.set_script_timeout(PAGE_LOAD_TIMEOUT)
+    
+    if blocked_patterns:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_patterns})
+        except Exception as e:
+            logging.warning(f"Could not apply resource blocking profile '{blocking_profile}': {e}")
     
     return driver
 
-def load_page_with_retry(driver, url, max_retries=5):
-    """Enhanced retry logic for AWS"""
+def load_page_with_retry(driver, url, max_retries=PAGE_LOAD_RETRIES):
+    """Enhanced retry logic for AWS
+
+    Loads wait for the host's rate limit; timeouts and block pages are
+    reported to rate_control and retried with jittered exponential backoff.
+    """
     for attempt in range(max_retries):
+        rate_control.wait_turn(url)
         try:
             driver.get(url)
-            return True
+            if not rate_control.is_block_page(driver.title):
+                return True
+            rate_control.throttled(url, "block_page", pause=rate_control.THROTTLE_PAUSE_SECONDS)
         except TimeoutException:
-            if attempt < max_retries - 1:
-                time.sleep(3 + attempt)  # Progressive backoff
-                continue
-            return False
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(3 + attempt)
-                continue
-            return False
+            rate_control.throttled(url, "timeout")
+        except Exception:
+            pass
+        if attempt < max_retries - 1:
+            metrics.RETRIES.labels(operation="page_load").inc()
+            time.sleep(rate_control.backoff(attempt, base=3))
     return False
 
 def get_detail_text(driver, selector, attribute=None, max_retries=3):
@@ -118,47 +212,284 @@ def get_detail_text(driver, selector, attribute=None, max_retries=3):
             return None
     return None
 
-# Helper functions from original scraper
+# Helper functions from original scraper; the parsing itself lives in normalize
 def clean_mileage(mileage_text):
-    if not mileage_text:
-        return None
-    numbers = re.sub(r'[^0-9]', '', mileage_text)
-    return int(numbers) if numbers else None
+    return normalize.to_int(mileage_text or None)
 
 def clean_payment(payment_text):
-    if not payment_text:
-        return None
-    numbers = re.sub(r'[^0-9]', '', payment_text)
-    return int(numbers) if numbers else None
+    return normalize.money(payment_text or None)
 
 def parse_car_title(title):
-    if not title:
-        return {"year": None, "make": None, "model": None}
-    
-    parts = title.strip().split()
-    if not parts:
-        return {"year": None, "make": None, "model": None}
-    
-    year = parts[0] if parts[0].isdigit() and len(parts[0]) == 4 else None
-    
-    if year and len(parts) > 1:
-        make = parts[1]
-        model = " ".join(parts[2:]) if len(parts) > 2 else None
-        return {"year": year, "make": make, "model": model}
-    
-    return {"year": None, "make": None, "model": None}
+    return normalize.parse_title(title)
+
+def extract_car_id(url):
+    return url.split('/vehicledetail/')[1].split('/')[0] if '/vehicledetail/' in url else url
+
+# Thumbnail positions kept from the gallery (first three exterior shots, a few
+# interior shots and one detail shot), capped at 7 images per car.
+IMAGE_INDICES = list(range(1, 4)) + list(range(8, 11)) + [14]
+MAX_IMAGES = normalize.MAX_IMAGES
+
+PAYMENT_SELECTORS = [
+    "#payment-result-value",
+    ".calculation-result.experience-embedded",
+    "[data-qa='payment-amount']",
+    ".payment-amount",
+    ".monthly-payment"
+]
 
-def scrape_car_details(driver, url):
+BREAKDOWN_SELECTORS = [
+    ".breakdown-section-details--grid, .breakdown-section-details--summary-grid",
+    ".payment-breakdown",
+    ".loan-breakdown",
+    "[data-qa='payment-breakdown']"
+]
+
+BREAKDOWN_PAIR_SELECTORS = [
+    ("dt.breakdown-section-details--title", "dd.breakdown-section-details--value"),
+    (".breakdown-title", ".breakdown-value"),
+    ("dt", "dd"),
+    (".title", ".value")
+]
+
+# Collects every field scrape_car_details needs in a single execute_async_script
+# call. Waits (in-page) for the basics section, opens the all-features modal,
+# reads everything and hands back one JSON-serialisable object.
+DETAIL_EXTRACTION_JS = """
+var imageIndices = arguments[0], paymentSelectors = arguments[1],
+    breakdownSelectors = arguments[2], pairSelectors = arguments[3],
+    structureTimeout = arguments[4], modalTimeout = arguments[5],
+    done = arguments[arguments.length - 1];
+
+function q(sel, root) { return (root || document).querySelector(sel); }
+function qa(sel, root) { return Array.prototype.slice.call((root || document).querySelectorAll(sel)); }
+function txt(el) { return el ? (el.innerText || '').trim() : null; }
+function content(sel) { var el = q(sel); return el ? (el.textContent || '').trim() : null; }
+function pairs(dl) {
+    if (!dl) return [];
+    var dts = qa('dt', dl), dds = qa('dd', dl), out = [];
+    for (var i = 0; i < Math.min(dts.length, dds.length); i++) out.push([dts[i], dds[i]]);
+    return out;
+}
+function poll(check, timeout, cb) {
+    var deadline = Date.now() + timeout;
+    (function tick() {
+        if (check() || Date.now() >= deadline) return cb();
+        setTimeout(tick, 50);
+    })();
+}
+
+var timings = {}, mark = performance.now();
+function lap(section) {
+    var now = performance.now();
+    timings[section] = (timings[section] || 0) + (now - mark);
+    mark = now;
+}
+
+function collect() {
+    var data = {
+        title: content('h1.listing-title'),
+        price: content("span[data-qa='primary-price']"),
+        status: content('p.new-used'),
+        seller: txt(q('h3.spark-heading-5.heading.seller-name')),
+        basics: [], features: [], all_features: [], images: [], breakdown: [],
+        additional_features: txt(q('.auto-corrected-feature-list')),
+        payment_text: null,
+        recall_href: null,
+        location: null
+    };
+
+    // The modal's open wait (if any) ran just before; reading and closing
+    // it here keeps the whole modal section in one lap
+    data.all_features = qa('.all-features-list .all-features-item').map(txt);
+    var close = q('.sds-modal .btn-close');
+    if (close && data.all_features.length) close.click();
+    lap('modal');
+
+    pairs(q('.basics-section dl.fancy-description-list')).forEach(function (p) {
+        data.basics.push([txt(p[0]), txt(p[1])]);
+    });
+    lap('basics');
+    pairs(q('.features-section dl.fancy-description-list')).forEach(function (p) {
+        data.features.push([txt(p[0]), qa('ul.vehicle-features-list li', p[1]).map(txt)]);
+    });
+    lap('features');
+
+    var thumbs = qa('gallery-thumbnails img');
+    imageIndices.forEach(function (idx) {
+        var img = thumbs[idx];
+        if (img) data.images.push({src: img.getAttribute('src'), modal_src: img.getAttribute('modal-src'), alt: img.getAttribute('alt')});
+    });
+    lap('images');
+
+    for (var i = 0; i < paymentSelectors.length; i++) {
+        var payment = txt(q(paymentSelectors[i]));
+        if (payment) { data.payment_text = payment; break; }
+    }
+
+    outer:
+    for (var s = 0; s < breakdownSelectors.length; s++) {
+        var sections = qa(breakdownSelectors[s]);
+        for (var k = 0; k < sections.length; k++) {
+            for (var j = 0; j < pairSelectors.length; j++) {
+                var dts = qa(pairSelectors[j][0], sections[k]), dds = qa(pairSelectors[j][1], sections[k]);
+                if (dts.length && dds.length) {
+                    for (var n = 0; n < Math.min(dts.length, dds.length); n++) data.breakdown.push([txt(dts[n]), txt(dds[n])]);
+                    break;
+                }
+            }
+            if (data.breakdown.some(function (p) { return p[0] && p[1]; })) break outer;
+        }
+    }
+
+    lap('payment');
+
+    var recall = q("a.sds-link--ext[data-linkname='check-recalls']");
+    if (recall) data.recall_href = recall.getAttribute('href');
+    lap('bodystyle');
+    data.location = content('.dealer-address');
+    lap('location');
+    data.timings = timings;
+    return data;
+}
+
+poll(function () { return q('.basics-section'); }, structureTimeout, function () {
+    lap('structure');
+    if (!q('.basics-section')) return done({structure_missing: true});
+    var button = q("spark-button[data-target='#allFeaturesModal']");
+    if (!button) return done(collect());
+    button.click();
+    poll(function () { return q('.all-features-list'); }, modalTimeout, function () { done(collect()); });
+});
+"""
+
+def parse_bodystyle(href):
+    return normalize.bodystyle_from_href(href)
+
+# "script" collects every field with one injected payload; "webdriver" is the
+# original element-by-element extraction, kept as a fallback.
+EXTRACTION_MODES = ("script", "webdriver")
+DEFAULT_EXTRACTION_MODE = "script"
+
+def scrape_car_details_script(driver, url):
+    """Single-round-trip car detail scraper using DETAIL_EXTRACTION_JS"""
+    car_id = extract_car_id(url)
+    max_retries = DETAIL_ATTEMPTS
+
+    for attempt in range(max_retries):
+        try:
+            with metrics.timed("detail_page_load"):
+                loaded = load_page_with_retry(driver, url)
+            if not loaded:
+                return {"id": car_id, "error": "Failed to load page"}
+
+            raw = driver.execute_async_script(
+                DETAIL_EXTRACTION_JS,
+                IMAGE_INDICES,
+                PAYMENT_SELECTORS,
+                BREAKDOWN_SELECTORS,
+                [list(pair) for pair in BREAKDOWN_PAIR_SELECTORS],
+                20000,
+                3000
+            )
+            if not raw or raw.get("structure_missing"):
+                return {"id": car_id, "error": "Page structure not found"}
+            metrics.observe_sections("script", raw.get("timings"))
+
+            # Normalized off the detail worker by normalize.NormalizationStage
+            return normalize.raw_record(car_id, raw)
+
+        except Exception as e:
+            error_msg = str(e)
+            if attempt < max_retries - 1:
+                time.sleep(rate_control.backoff(attempt, base=3))
+                continue
+            return {"id": car_id, "error": error_msg[:200]}
+
+    return None
+
+# Client-rendered sections that send an HTTP-scraped page to the browser fallback
+HTTP_FALLBACK_SECTIONS = ("all_features", "payment")
+HTTP_FALLBACK_DRIVERS = 1  # Chrome instances the "http" engine may start for fallbacks
+
+# "selenium" drives one Chrome per worker; "http" fetches detail pages with
+# requests and only falls back to Chrome for client-rendered sections; "async"
+# runs the whole crawl on one event loop (see async_crawler).
+ENGINES = ("selenium", "http", "async")
+
+def parse_car_details_html(url, page_html):
+    """Parse a fetched detail page; returns (car_data, needs_browser)
+
+    needs_browser is set only when the page loaded but its structure or
+    client-rendered sections are missing; a failed fetch is an error, since
+    Chrome would hit the same 404 or network failure.
+    """
+    car_id = extract_car_id(url)
+    if page_html is None:
+        return {"id": car_id, "error": "Failed to load page"}, False
+
+    raw = http_scraper.parse_detail_html(
+        page_html,
+        IMAGE_INDICES,
+        PAYMENT_SELECTORS,
+        BREAKDOWN_SELECTORS,
+        BREAKDOWN_PAIR_SELECTORS
+    )
+    if raw.get("structure_missing"):
+        return {"id": car_id, "error": "Page structure not found"}, True
+
+    needs_browser = any(section in HTTP_FALLBACK_SECTIONS for section in raw["js_sections"])
+    return normalize.raw_record(car_id, raw), needs_browser
+
+def scrape_car_details_http(session, url, fallback=None):
+    """Browserless car detail scraper; hands JS-dependent pages to fallback(url)"""
+    with tracing.span("scrape_car_details_http", url=url) as span:
+        with metrics.timed("detail_page_fetch"):
+            page_html = http_scraper.fetch_page(session, url)
+        car_data, needs_browser = parse_car_details_html(url, page_html)
+        span.set(needs_browser=needs_browser)
+        if needs_browser and fallback:
+            return fallback(url)
+        return car_data
+
+class FallbackBrowsers:
+    """Pooled Chrome for pages the HTTP engines cannot parse, capped at size at a time"""
+
+    def __init__(self, pool, size=HTTP_FALLBACK_DRIVERS, extraction_mode=DEFAULT_EXTRACTION_MODE):
+        self.pool = pool
+        self.extraction_mode = extraction_mode
+        self.slots = threading.Semaphore(size)
+
+    def scrape(self, url):
+        with self.slots, self.pool.lease() as driver:
+            result = scrape_car_details(driver, url, self.extraction_mode)
+            if not result or result.get("error"):
+                self.pool.suspect(driver)
+            return result
+
+def scrape_car_details(driver, url, extraction_mode=DEFAULT_EXTRACTION_MODE):
+    """Scrape one listing using the requested extraction mode"""
+    with tracing.span("scrape_car_details", url=url, mode=extraction_mode) as span:
+        if extraction_mode == "script":
+            result = scrape_car_details_script(driver, url)
+        else:
+            result = scrape_car_details_webdriver(driver, url)
+        if result and result.get("error"):
+            span.set(error=result["error"])
+        return result
+
+def scrape_car_details_webdriver(driver, url):
     """AWS-optimized car detail scraper with enhanced error handling"""
-    import time as _time
-    start_total = _time.perf_counter()
-    max_retries = 3
+    max_retries = DETAIL_ATTEMPTS
     
     for attempt in range(max_retries):
         try:
-            if not load_page_with_retry(driver, url):
-                car_id = url.split('/vehicledetail/')[1].split('/')[0] if '/vehicledetail/' in url else url
+            with metrics.timed("detail_page_load"):
+                loaded = load_page_with_retry(driver, url)
+            if not loaded:
+                car_id = extract_car_id(url)
                 return {"id": car_id, "error": "Failed to load page"}
+            sections = metrics.SectionClock("webdriver")
 
             # Wait for page structure
             try:
@@ -166,20 +497,21 @@ def scrape_car_details(driver, url):
                     EC.presence_of_element_located((By.CSS_SELECTOR, ".basics-section"))
                 )
             except TimeoutException:
-                car_id = url.split('/vehicledetail/')[1].split('/')[0] if '/vehicledetail/' in url else url
+                car_id = extract_car_id(url)
                 return {"id": car_id, "error": "Page structure not found"}
+            sections.lap("structure")
 
             # Check for excluded sellers
             try:
                 seller_element = driver.find_element(By.CSS_SELECTOR, "h3.spark-heading-5.heading.seller-name")
                 seller_name = seller_element.text.strip()
                 if any(excluded in seller_name for excluded in EXCLUDED_SELLERS):
-                    car_id = url.split('/vehicledetail/')[1].split('/')[0] if '/vehicledetail/' in url else url
+                    car_id = extract_car_id(url)
                     return {"id": car_id, "error": "Skipped - excluded seller"}
             except:
                 pass
 
-            car_id = url.split('/vehicledetail/')[1].split('/')[0] if '/vehicledetail/' in url else url
+            car_id = extract_car_id(url)
             title = get_detail_text(driver, "h1.listing-title")
             
             car_data = {
@@ -210,9 +542,7 @@ def scrape_car_details(driver, url):
                 
                 for dt, dd in zip(dt_elements, dd_elements):
                     try:
-                        raw_key = dt.text.strip().lower()
-                        sanitized_key = re.sub(r'[^a-z0-9\s]', '', raw_key)
-                        key = sanitized_key.replace(' ', '_')
+                        key = normalize.field_key(dt.text)
                         value = dd.text.strip()
                         if key and value:
                             if key == 'mileage':
@@ -223,6 +553,8 @@ def scrape_car_details(driver, url):
             except:
                 pass
             
+            sections.lap("basics")
+            
             # --- Features Section ---
             try:
                 features_dl = WebDriverWait(driver, 8).until(
@@ -251,6 +583,8 @@ def scrape_car_details(driver, url):
             except:
                 pass
             
+            sections.lap("features")
+            
             # --- All Features from Modal ---
             try:
                 view_all_features_btn = driver.find_element(By.CSS_SELECTOR, "spark-button[data-target='#allFeaturesModal']")
@@ -267,13 +601,14 @@ def scrape_car_details(driver, url):
             except:
                 pass
             
+            sections.lap("modal")
+            
             # --- Images ---
             try:
                 image_data = []
                 images = driver.find_elements(By.CSS_SELECTOR, "gallery-thumbnails img")
-                indices_to_scrape = list(range(1, 4)) + list(range(8, 11)) + [14]
                 for idx, img in enumerate(images):
-                    if idx in indices_to_scrape:
+                    if idx in IMAGE_INDICES:
                         try:
                             src = img.get_attribute("src")
                             if src:
@@ -287,7 +622,7 @@ def scrape_car_details(driver, url):
                                     "alt": alt if alt else ""
                                 }
                                 image_data.append(image_info)
-                                if len(image_data) == 7:
+                                if len(image_data) == MAX_IMAGES:
                                     break
                         except:
                             continue
@@ -296,18 +631,12 @@ def scrape_car_details(driver, url):
             except:
                 pass
             
+            sections.lap("images")
+            
             # --- Payment Information ---
             try:
-                payment_selectors = [
-                    "#payment-result-value",
-                    ".calculation-result.experience-embedded",
-                    "[data-qa='payment-amount']",
-                    ".payment-amount",
-                    ".monthly-payment"
-                ]
-                
                 payment_text = None
-                for selector in payment_selectors:
+                for selector in PAYMENT_SELECTORS:
                     try:
                         payment_element = driver.find_element(By.CSS_SELECTOR, selector)
                         payment_text = payment_element.text.strip()
@@ -317,41 +646,20 @@ def scrape_car_details(driver, url):
                         continue
                 
                 if payment_text:
-                    cleaned_payment = clean_payment(payment_text)
-                    car_data["start_payment"] = cleaned_payment if cleaned_payment is not None else "Not available"
+                    car_data["start_payment"] = clean_payment(payment_text)
                 else:
-                    car_data["start_payment"] = "Not available"
+                    car_data["start_payment"] = None
                 
                 # Extract breakdown details
                 breakdown_data = {}
-                breakdown_selectors = [
-                    ".breakdown-section-details--grid, .breakdown-section-details--summary-grid",
-                    ".payment-breakdown",
-                    ".loan-breakdown",
-                    "[data-qa='payment-breakdown']"
-                ]
-                
                 breakdown_found = False
-                for selector in breakdown_selectors:
+                for selector in BREAKDOWN_SELECTORS:
                     try:
                         breakdown_sections = driver.find_elements(By.CSS_SELECTOR, selector)
                         if breakdown_sections:
                             for section in breakdown_sections:
                                 try:
-                                    title_selectors = [
-                                        "dt.breakdown-section-details--title",
-                                        ".breakdown-title",
-                                        "dt",
-                                        ".title"
-                                    ]
-                                    value_selectors = [
-                                        "dd.breakdown-section-details--value",
-                                        ".breakdown-value",
-                                        "dd",
-                                        ".value"
-                                    ]
-                                    
-                                    for title_sel, value_sel in zip(title_selectors, value_selectors):
+                                    for title_sel, value_sel in BREAKDOWN_PAIR_SELECTORS:
                                         try:
                                             dt_elements = section.find_elements(By.CSS_SELECTOR, title_sel)
                                             dd_elements = section.find_elements(By.CSS_SELECTOR, value_sel)
@@ -362,8 +670,8 @@ def scrape_car_details(driver, url):
                                                         title = dt.text.strip()
                                                         value = dd.text.strip()
                                                         if title and value:
-                                                            clean_title = re.sub(r'[^a-zA-Z0-9\s]', '', title).strip().lower().replace(' ', '_')
-                                                            if any(keyword in clean_title for keyword in ['price', 'payment', 'amount', 'paid', 'value']):
+                                                            clean_title, holds_money = normalize.breakdown_key(title)
+                                                            if holds_money:
                                                                 value = clean_payment(value)
                                                             breakdown_data[clean_title] = value
                                                     except StaleElementReferenceException:
@@ -386,33 +694,25 @@ def scrape_car_details(driver, url):
                 if breakdown_data:
                     car_data["payment_breakdown"] = json.dumps(breakdown_data)
                 else:
-                    car_data["payment_breakdown"] = "No breakdown available"
+                    car_data["payment_breakdown"] = None
                     
             except:
-                car_data["start_payment"] = "Not available"
-                car_data["payment_breakdown"] = "Not available"
+                car_data["start_payment"] = None
+                car_data["payment_breakdown"] = None
+            
+            sections.lap("payment")
             
             # --- Bodystyle Extraction ---
             try:
                 a_tag = driver.find_element(By.CSS_SELECTOR, "a.sds-link--ext[data-linkname='check-recalls']")
-                href = a_tag.get_attribute("href")
-
-                bodystyle = None
-                if '?' in href:
-                    parsed = urllib.parse.urlparse(href)
-                    qs = urllib.parse.parse_qs(parsed.query)
-                    bodystyle = qs.get('bodystyle', [None])[0]
-
-                if not bodystyle:
-                    match = re.search(r'bodystyle=([^&]+)', href)
-                    if match:
-                        bodystyle = match.group(1)
-
+                bodystyle = parse_bodystyle(a_tag.get_attribute("href"))
                 if bodystyle:
                     car_data['bodystyle'] = bodystyle
             except:
                 pass
             
+            sections.lap("bodystyle")
+            
             # --- Dealer Location ---
             try:
                 location = get_detail_text(driver, ".dealer-address")
@@ -420,8 +720,8 @@ def scrape_car_details(driver, url):
                     car_data["location"] = location
             except:
                 pass
+            sections.lap("location")
 
-            car_data["status_flag"] = "New Entry"
             car_data["last_updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
             
             return car_data
@@ -429,18 +729,50 @@ def scrape_car_details(driver, url):
         except Exception as e:
             error_msg = str(e)
             if attempt < max_retries - 1:
-                time.sleep(3 + attempt)
+                time.sleep(rate_control.backoff(attempt, base=3))
                 continue
             
-            car_id = url.split('/vehicledetail/')[1].split('/')[0] if '/vehicledetail/' in url else url
+            car_id = extract_car_id(url)
             return {"id": car_id, "error": error_msg[:200]}
     
     return None
 
-EXCLUDED_SELLERS = ["CarMax", "Carvana"]
+EXCLUDED_SELLERS = normalize.EXCLUDED_SELLERS
+
+def build_filters(stock_type='all', makes=None, models=None, zip_code='60606', max_distance=50,
+                  list_price_min=None, list_price_max=None, year_min=None, year_max=None,
+                  mileage_max=None, body_styles=None, fuel_types=None):
+    return {
+        "stock_type": stock_type,
+        "makes": makes or [],
+        "models": models or [],
+        "zip_code": zip_code,
+        "max_distance": max_distance,
+        "list_price_min": list_price_min,
+        "list_price_max": list_price_max,
+        "year_min": year_min,
+        "year_max": year_max,
+        "mileage_max": mileage_max,
+        "body_styles": body_styles or [],
+        "fuel_types": fuel_types or []
+    }
+
+def scope_key(filters, start_page, end_page, searches=None):
+    """Stable id for a search (filters + page range), used for removal detection
+
+    A sharded search covers more listings than the same page range of the
+    unsharded one, so its shard plan is part of the key.
+    """
+    scope = {"filters": filters, "pages": [start_page, end_page]}
+    if searches and len(searches) > 1:
+        scope["shards"] = searches
+    return hashlib.sha1(json.dumps(scope, sort_keys=True).encode("utf-8")).hexdigest()
+
+# Overridable so benchmarks can point the scraper at a local stand-in
+CARS_BASE_URL = os.environ.get("CARS_BASE_URL", "https://www.cars.com")
 
 def build_url(filters, page):
-    base_url = "https://www.cars.com/shopping/results/?"
+    base_url = f"{CARS_BASE_URL}/shopping/results/?"
     params = []
     
     if filters.get("stock_type"):
@@ -475,6 +807,226 @@ def build_url(filters, page):
     params.append(f"page={page}")
     return base_url + "&".join(params)
 
+# Result pages fetched concurrently by the link producer, and how many
+# discovered links may wait for a detail worker before the producer blocks
+PAGE_WORKERS = 2
+# Sharded searches get at least one page worker per shard, up to this many
+SHARD_PAGE_WORKERS = 4
+LINK_QUEUE_SIZE = 200
+# Detail scrapes submitted ahead of the workers; the link queue backs up
+# behind this instead of the executor holding a future for every link
+IN_FLIGHT_PER_WORKER = 2
+
+EXPECTED_CARDS_PER_PAGE = 20
+CARDS_FIRST_TIMEOUT_MS = 15000   # wait for the first card, like the old WebDriverWait
+CARDS_SETTLE_MS = 400            # no new cards for this long means the page is done
+CARDS_MAX_WAIT_MS = 10000        # hard cap on lazy-load waiting after the first card
+
+# Scrolls to the bottom and watches the vehicle-card count with a
+# MutationObserver; resolves as soon as the expected count is reached or the
+# count has not changed for settleMs, instead of sleeping a fixed second per scroll.
+WAIT_FOR_CARDS_JS = """
+var expected = arguments[0], firstTimeout = arguments[1], settleMs = arguments[2],
+    maxWait = arguments[3], done = arguments[arguments.length - 1];
+var start = Date.now(), firstDeadline = start + firstTimeout, deadline = null;
+var lastCount = -1, settleTimer = null, finished = false, observer = null;
+
+function count() { return document.querySelectorAll('div.vehicle-card').length; }
+function finish(reason) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearTimeout(settleTimer);
+    clearInterval(poller);
+    done({count: count(), elapsed_ms: Date.now() - start, reason: reason});
+}
+function check() {
+    var n = count(), now = Date.now();
+    if (n === 0) {
+        if (now >= firstDeadline) finish('no-cards');
+        return;
+    }
+    if (deadline === null) deadline = now + maxWait;
+    if (n >= expected) return finish('expected-count');
+    if (now >= deadline) return finish('deadline');
+    if (n !== lastCount) {
+        lastCount = n;
+        window.scrollTo(0, document.body.scrollHeight);
+        clearTimeout(settleTimer);
+        settleTimer = setTimeout(function () { finish('settled'); }, settleMs);
+    }
+}
+
+observer = new MutationObserver(check);
+observer.observe(document.body, {childList: true, subtree: true});
+// Backstop for deadlines when no mutations arrive
+var poller = setInterval(check, 100);
+check();
+"""
+
+def wait_for_cards(driver, expected=EXPECTED_CARDS_PER_PAGE):
+    """Block until the results page's vehicle cards stop loading
+
+    Returns {"count", "elapsed_ms", "reason"} from WAIT_FOR_CARDS_JS.
+    """
+    return driver.execute_async_script(
+        WAIT_FOR_CARDS_JS, expected, CARDS_FIRST_TIMEOUT_MS, CARDS_SETTLE_MS, CARDS_MAX_WAIT_MS
+    )
+
+CARD_PRICE_SELECTOR = ".primary-price"
+CARD_MILEAGE_SELECTOR = ".mileage"
+
+# Reads link, price and mileage for every results card in one round trip
+RESULT_CARDS_JS = """
+var priceSel = arguments[0], mileageSel = arguments[1];
+function text(card, sel) { var el = card.querySelector(sel); return el ? el.textContent.trim() : null; }
+return Array.prototype.map.call(document.querySelectorAll('div.vehicle-card'), function (card) {
+    var link = card.querySelector('a.vehicle-card-link');
+    return {url: link ? link.href : null, price: text(card, priceSel), mileage: text(card, mileageSel)};
+});
+"""
+
+def parse_result_cards(raw_cards):
+    """Normalize raw results cards into {"url", "price", "mileage"} dicts"""
+    return [
+        {"url": card["url"], "price": clean_payment(card.get("price")), "mileage": clean_mileage(card.get("mileage"))}
+        for card in raw_cards or []
+        if card.get("url")
+    ]
+
+def collect_page_links(driver, url):
+    """Load one search results page and return its vehicle cards (url, price, mileage)"""
+    start = time.perf_counter()
+    if not load_page_with_retry(driver, url):
+        return None
+    load_seconds = time.perf_counter() - start
+    metrics.observe_stage("results_page_load", load_seconds)
+    
+    # Scroll to load all cards
+    settled = wait_for_cards(driver)
+    if settled:
+        metrics.observe_stage("cards_settle", settled["elapsed_ms"] / 1000.0)
+    if not settled or not settled.get("count"):
+        raise TimeoutException("No vehicle cards found on results page")
+    logging.info(
+        f"Results page ready in {time.perf_counter() - start:.2f}s "
+        f"(load {load_seconds:.2f}s, cards {settled['count']} settled in {settled['elapsed_ms']}ms: {settled['reason']})"
+    )
+    
+    return parse_result_cards(driver.execute_script(RESULT_CARDS_JS, CARD_PRICE_SELECTOR, CARD_MILEAGE_SELECTOR))
+
+def produce_links(pool, searches, start_page, end_page, link_queue, page_workers, links_found,
+                  checkpoint=None, progress=None, stop=None):
+    """Fetch result pages concurrently and push their cards into link_queue
+
+    searches is the list of shard filters from query_planner.plan_shards;
+    each is walked from start_page to end_page and workers take pages from
+    the shards in turn, so all of them progress in parallel. Within a
+    shard pages are claimed in order; a page that fails to load or has no
+    cards stops any later page of that shard from being claimed, like the
+    old serial walk did. With a checkpoint, its unfinished links are queued
+    first, pages it has already walked are skipped and only newly
+    discovered cards are queued. A None sentinel is queued once every page
+    worker has finished; setting stop ends the walk after the pages in flight.
+    """
+    lock = threading.Lock()
+    shards = [{"next": start_page, "last": end_page} for _ in searches]
+    turn = [0]
+    pages_done = set()
+    if checkpoint:
+        pages_done = checkpoint.pages_done()
+        pending = checkpoint.pending_cards()
+        if pending or pages_done:
+            logging.info(f"Resuming: {len(pages_done)} pages already walked, {len(pending)} links pending")
+        links_found[0] += len(pending)
+        if progress:
+            planned = {query_planner.page_key(shard, page)
+                       for shard in range(len(searches)) for page in range(start_page, end_page + 1)}
+            progress.resumed(len(pages_done & planned), len(pending))
+        for card in pending:
+            link_queue.put(card)
+    
+    def claim_page():
+        with lock:
+            if stop is not None and stop.is_set():
+                return None
+            for _ in range(len(shards)):
+                shard = turn[0]
+                turn[0] = (turn[0] + 1) % len(shards)
+                state = shards[shard]
+                while query_planner.page_key(shard, state["next"]) in pages_done:
+                    state["next"] += 1
+                page = state["next"]
+                if page <= state["last"]:
+                    state["next"] += 1
+                    return shard, page
+            return None
+    
+    def page_worker():
+        try:
+            while True:
+                claim = claim_page()
+                if claim is None:
+                    break
+                shard, page = claim
+                label = f"Shard {shard} page {page}" if len(searches) > 1 else f"Page {page}"
+                try:
+                    with tracing.span("results_page", page=page, shard=shard) as span, pool.lease() as driver:
+                        page_links = collect_page_links(driver, build_url(searches[shard], page))
+                        span.set(cards=len(page_links or []))
+                        if page_links is None:
+                            pool.suspect(driver)
+                except Exception as e:
+                    logging.error(f"Error collecting links from {label.lower()}: {e}")
+                    page_links = None
+                
+                if not page_links:
+                    with lock:
+                        state = shards[shard]
+                        dropped = max(state["last"] - (page - 1), 0)
+                        state["last"] = min(state["last"], page - 1)
+                    if progress and dropped:
+                        progress.results_end(dropped)
+                    continue
+                
+                logging.info(f"{label}: {len(page_links)} links")
+                if checkpoint:
+                    page_links = checkpoint.record_page(query_planner.page_key(shard, page), page_links, extract_car_id)
+                with lock:
+                    links_found[0] += len(page_links)
+                if progress:
+                    progress.page_done(len(page_links))
+                for card in page_links:
+                    link_queue.put(card)
+        except Exception as e:
+            logging.error(f"Link producer failed: {e}")
+    
+    try:
+        workers = max(1, min(page_workers, (end_page - start_page + 1) * len(searches)))
+        with ThreadPoolExecutor(max_workers=workers) as pages:
+            for _ in range(workers):
+                pages.submit(page_worker)
+    finally:
+        link_queue.put(None)
+
+def bounded_map(executor, fn, items, max_in_flight):
+    """Run fn(item) for each item with at most max_in_flight submitted at a time
+
+    Yields (item, future) as futures complete, in completion order. items
+    is consumed lazily, so a slow executor stops it from being drained.
+    """
+    pending = {}
+    for item in items:
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+        pending[executor.submit(fn, item)] = item
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
 def scrape_cars(
     stock_type: str = 'all',
     makes=None,
@@ -491,167 +1043,304 @@ def scrape_cars(
     start_page: int = 1,
     end_page: int = 1,
     max_workers=3,  # Reduced for AWS
-    user_email=None
+    user_email=None,
+    extraction_mode=DEFAULT_EXTRACTION_MODE,
+    engine="selenium",
+    page_workers=PAGE_WORKERS,
+    incremental=True,
+    freshness_ttl_hours=listing_index.DEFAULT_TTL_HOURS,
+    task_id=None,
+    progress=None,
+    shards=1,
+    shard_by=None
 ):
-    """AWS-optimized scraper with better resource management"""
-    filters = {
-        "stock_type": stock_type,
-        "makes": makes or [],
-        "models": models or [],
-        "zip_code": zip_code,
-        "max_distance": max_distance,
-        "list_price_min": list_price_min,
-        "list_price_max": list_price_max,
-        "year_min": year_min,
-        "year_max": year_max,
-        "mileage_max": mileage_max,
-        "body_styles": body_styles or [],
-        "fuel_types": fuel_types or []
-    }
+    """AWS-optimized scraper with better resource management
+
+    With a task_id, progress is checkpointed to local disk and a rerun with
+    the same task_id resumes where the previous run stopped. A
+    progress.JobProgress passed as progress is kept up to date while the
+    job runs.
+    
+    With shards > 1 the search is split by query_planner into disjoint
+    sub-searches (by shard_by: price, year or make) that are walked in
+    parallel, each over start_page..end_page; cars found by more than one
+    shard are scraped once.
+    
+    Records are uploaded as they are scraped and not kept; returns
+    {"cars": <records scraped>, "errors": [...]}.
+    """
+    if engine == "async":
+        import async_crawler
+        return asyncio.run(async_crawler.crawl_cars(
+            stock_type=stock_type, makes=makes, models=models, zip_code=zip_code,
+            max_distance=max_distance, list_price_min=list_price_min,
+            list_price_max=list_price_max, year_min=year_min, year_max=year_max,
+            mileage_max=mileage_max, body_styles=body_styles, fuel_types=fuel_types,
+            start_page=start_page, end_page=end_page, concurrency=max_workers,
+            user_email=user_email, extraction_mode=extraction_mode, page_workers=page_workers,
+            incremental=incremental, freshness_ttl_hours=freshness_ttl_hours, task_id=task_id,
+            progress=progress, shards=shards, shard_by=shard_by
+        ))
+
+    filters = build_filters(
+        stock_type, makes, models, zip_code, max_distance, list_price_min, list_price_max,
+        year_min, year_max, mileage_max, body_styles, fuel_types
+    )
     
     logging.info(f"AWS Scraping started with filters: {filters}")
     
-    # Collect links
-    main_driver = setup_driver()
-    all_links = []
+    searches = query_planner.plan_shards(filters, shards, shard_by)
+    if len(searches) > 1:
+        logging.info(f"Search split into {len(searches)} shards: {searches}")
+        page_workers = max(page_workers, min(len(searches), SHARD_PAGE_WORKERS))
+        if progress:
+            progress.sharded(len(searches))
     
-    try:
-        for page in range(start_page, end_page + 1):
-            url = build_url(filters, page)
-            if not load_page_with_retry(main_driver, url):
-                break
-                
-            WebDriverWait(main_driver, 15).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div.vehicle-card"))
-            )
-            
-            # Scroll to load all cards
-            last_height = main_driver.execute_script("return document.body.scrollHeight")
-            while True:
-                main_driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(1)
-                new_height = main_driver.execute_script("return document.body.scrollHeight")
-                if new_height == last_height:
-                    break
-                last_height = new_height
-            
-            cards = main_driver.find_elements(By.CSS_SELECTOR, "div.vehicle-card")
-            page_links = []
-            
-            for card in cards:
-                try:
-                    link = card.find_element(By.CSS_SELECTOR, "a.vehicle-card-link").get_attribute('href')
-                    if link:
-                        page_links.append(link)
-                except:
-                    continue
-            
-            all_links.extend(page_links)
-            if not page_links:
-                break
-                
-    finally:
-        main_driver.quit()
+    # Drivers come from the server's long-lived pool; standalone runs get a
+    # private pool sized for this job that is closed when it finishes.
+    pool = browser_pool.get_pool()
+    owns_pool = pool is None
+    if owns_pool:
+        pool = browser_pool.BrowserPool(setup_driver, size=max_workers + page_workers,
+                                        max_lease_seconds=MAX_LEASE_SECONDS)
+    
+    job_checkpoint = checkpoint.JobCheckpoint(task_id) if task_id else None
+    # Shared with concurrent jobs so overlapping searches scrape each car once
+    link_frontier = frontier.LinkFrontier(task_id or uuid.uuid4().hex)
     
-    logging.info(f"Found {len(all_links)} car links to process.")
+    # Link discovery runs as a producer stage: result pages are fetched
+    # concurrently and links flow to the detail workers as they are found.
+    link_queue = Queue(maxsize=LINK_QUEUE_SIZE)
+    links_found = [0]
+    stop_producer = threading.Event()
+    producer = threading.Thread(
+        target=produce_links,
+        args=(pool, searches, start_page, end_page, link_queue, page_workers, links_found, job_checkpoint, progress,
+              stop_producer),
+        daemon=True
+    )
+    producer.start()
     
-    # Process links with reduced concurrency for AWS
-    scraped_data = []
+    # Process links with reduced concurrency for AWS. Records are not kept:
+    # each one is released once its batch has been uploaded.
+    scraped_count = [0]
     errors = []
-    batch_size = 50  # Smaller batches for AWS
-    max_workers = min(max_workers, len(all_links))
+    seen_ids = []
+    shared_ids = []
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        from queue import Queue
-        driver_queue = Queue()
+    # Incremental mode skips listings whose results card still matches the
+    # last scrape; the index is only updated once a record reaches WordPress.
+    index = listing_index.ListingIndex() if incremental else None
+    cards_by_id = {}
+    fresh_ids = []
+    
+    def release(batch):
+        link_frontier.done([car["id"] for car in batch])
+        for car in batch:
+            cards_by_id.pop(car["id"], None)
+    
+    def on_uploaded(batch_id, batch):
+        if index:
+            index.record(batch, cards_by_id)
+        if job_checkpoint:
+            job_checkpoint.record_batch(batch_id, batch)
+        release(batch)
+    
+    def on_spooled(batch_id, batch):
+        # Spooled records reach WordPress through replay_spool, not a resume
+        if job_checkpoint:
+            job_checkpoint.record_batch(batch_id, batch)
+        release(batch)
+    
+    # Uploads run on their own stage so result collection never waits on WordPress
+    batch_uploader = uploader.BatchUploader(on_uploaded=on_uploaded, on_spooled=on_spooled)
+    
+    def on_record(link, car_data):
+        if job_checkpoint:
+            job_checkpoint.mark(link, checkpoint.SCRAPED, record=car_data)
+        scraped_count[0] += 1
+        batch_uploader.put(car_data)
+    
+    def on_rejected(link, error):
+        logging.error(f"Error scraping {link}: {error}")
+        errors.append({"link": link, "error": error})
+        link_frontier.release(extract_car_id(link))
+        if job_checkpoint:
+            job_checkpoint.mark(link, checkpoint.FAILED, error=str(error)[:500])
+    
+    # Detail workers hand raw extractions to this stage instead of
+    # normalizing them while holding a browser
+    normalizer = normalize.NormalizationStage(on_record, on_error=on_rejected)
+    
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # max_workers is the ceiling; how many scrape at once adapts to the site (AIMD)
+    limiter = rate_control.AdaptiveConcurrency(max_workers)
+    completed = False
+    try:
+        if job_checkpoint:
+            # Records an interrupted run scraped but never got to WordPress
+            for card, record in job_checkpoint.scraped_records():
+                cards_by_id[record["id"]] = card
+                batch_uploader.put(record)
+        
+        if engine == "http":
+            # Browserless workers share one pooled session; Chrome is only
+            # leased for pages that need client-side rendering.
+            session = http_scraper.create_session(pool_maxsize=max_workers)
+            fallback = FallbackBrowsers(pool, extraction_mode=extraction_mode)
         
-        # Create fewer drivers for AWS
-        for _ in range(max_workers):
+        def handle_result(link, result, started):
+            if progress:
+                progress.car_done(time.time() - started, ok=bool(result) and 'error' not in result)
+            if result and 'error' in result:
+                on_rejected(link, result['error'])
+            elif result:
+                normalizer.put(link, result)
+        
+        def scrape_with_session(link):
+            started = time.time()
             try:
-                driver = setup_driver()
-                driver_queue.put(driver)
+                with limiter.slot() as slot:
+                    started = time.time()
+                    result = scrape_car_details_http(session, link, fallback=fallback.scrape)
+                    slot.ok = bool(result) and 'error' not in result
+                handle_result(link, result, started)
             except Exception as e:
-                logging.error(f"Error setting up driver: {e}")
+                on_rejected(link, str(e))
+                if progress:
+                    progress.car_done(time.time() - started, ok=False)
         
-        def scrape_with_driver(link, car_index):
-            driver = None
+        def scrape_with_driver(link):
+            started = time.time()
             try:
-                driver = driver_queue.get(timeout=15)
-                result = scrape_car_details(driver, link)
-                
-                if result and 'error' in result:
-                    logging.error(f"Error scraping {link}: {result['error']}")
-                    errors.append({"link": link, "error": result['error']})
-                
-                return result if result and 'error' not in result else None
+                # The slot is taken before the lease so queued workers hold no browser
+                with limiter.slot() as slot, pool.lease() as driver:
+                    started = time.time()
+                    result = scrape_car_details(driver, link, extraction_mode)
+                    slot.ok = bool(result) and 'error' not in result
+                    if not slot.ok:
+                        pool.suspect(driver)
+                handle_result(link, result, started)
                 
             except Exception as e:
-                logging.error(f"Error scraping {link}: {e}")
-                errors.append({"link": link, "error": str(e)})
-                return None
-            finally:
-                if driver:
-                    try:
-                        driver.current_url
-                        driver_queue.put(driver)
-                    except:
-                        try:
-                            new_driver = setup_driver()
-                            driver_queue.put(new_driver)
-                        except:
-                            pass
+                on_rejected(link, str(e))
+                if progress:
+                    progress.car_done(time.time() - started, ok=False)
         
-        # Process with timeout handling
-        futures = []
-        for i, link in enumerate(all_links):
-            future = executor.submit(scrape_with_driver, link, i)
-            futures.append(future)
+        def links_to_scrape():
+            """Links from the producer that need a detail scrape, as they arrive"""
+            while True:
+                card = link_queue.get()
+                if card is None:
+                    return
+                link = card["url"]
+                car_id = extract_car_id(link)
+                if not link_frontier.first_sighting(car_id):
+                    if job_checkpoint:
+                        job_checkpoint.mark(link, checkpoint.SHARED)
+                    continue
+                seen_ids.append(car_id)
+                if index and index.is_fresh(car_id, card["price"], card["mileage"], freshness_ttl_hours):
+                    fresh_ids.append(car_id)
+                    if job_checkpoint:
+                        job_checkpoint.mark(link, checkpoint.SKIPPED)
+                    if progress:
+                        progress.car_skipped()
+                    continue
+                outcome = link_frontier.admit(car_id, reuse_recent=incremental)
+                if outcome == frontier.RECENT:
+                    # Another job just scraped and uploaded it: unchanged, like a fresh listing
+                    fresh_ids.append(car_id)
+                    if job_checkpoint:
+                        job_checkpoint.mark(link, checkpoint.SKIPPED)
+                    if progress:
+                        progress.car_skipped()
+                    continue
+                if outcome != frontier.ADMITTED:
+                    # Another job is scraping it or just uploaded it
+                    shared_ids.append(car_id)
+                    if job_checkpoint:
+                        job_checkpoint.mark(link, checkpoint.SHARED)
+                    if progress:
+                        progress.car_skipped()
+                    continue
+                cards_by_id[car_id] = card
+                yield link
         
-        for i, future in enumerate(futures):
+        # Links are pulled from the producer only as workers free up, and
+        # finished scrapes are collected in completion order
+        scrape_link = scrape_with_session if engine == "http" else scrape_with_driver
+        processed = 0
+        for link, future in bounded_map(executor, scrape_link, links_to_scrape(), max_workers * IN_FLIGHT_PER_WORKER):
+            processed += 1
             try:
-                result = future.result(timeout=90)  # Increased timeout for AWS
-                if result:
-                    scraped_data.append(result)
-                    
-                    # Send smaller batches more frequently
-                    if len(scraped_data) % batch_size == 0:
-                        batch = scraped_data[-batch_size:]
-                        db.update_wordpress_database(batch)
-                        logging.info(f"Batch sent: {len(batch)} records to WordPress.")
-                
-                if (i + 1) % 10 == 0 or (i + 1) == len(all_links):
-                    logging.info(f"Processed {i + 1} of {len(all_links)} cars...")
-                    
+                future.result()
             except Exception as e:
-                logging.error(f"Error in future for car {i+1}: {e}")
-                errors.append({"link": all_links[i], "error": str(e)})
+                logging.error(f"Error in future for {link}: {e}")
+                errors.append({"link": link, "error": str(e)})
+            if processed % 10 == 0:
+                logging.info(f"Processed {processed} of {links_found[0]} cars found so far...")
         
-        # Clean up drivers
-        while not driver_queue.empty():
-            try:
-                driver = driver_queue.get_nowait()
-                driver.quit()
-            except:
-                pass
+        logging.info(f"Found {len(seen_ids)} car links, processed {processed} "
+                     f"({len(fresh_ids)} unchanged since last scrape, {len(shared_ids)} left to other jobs).")
+        completed = True
+        
+    finally:
+        if not completed:
+            # Stop the producer and unblock it so its thread can exit
+            stop_producer.set()
+            while producer.is_alive():
+                try:
+                    link_queue.get(timeout=1)
+                except Empty:
+                    pass
+        # Scrapes not yet started are dropped when the job is aborted
+        executor.shutdown(wait=True, cancel_futures=not completed)
+        logging.info(f"Final concurrency limit: {limiter.limit} of {max_workers}")
+        limiter.close()
+        
+        # Flush the remaining records and wait for in-flight uploads
+        if progress:
+            progress.set_stage("uploading")
+        normalizer.close()
+        upload_stats = batch_uploader.close()
+        logging.info(f"Uploads: {upload_stats}")
+        link_frontier.close()
+        
+        if job_checkpoint:
+            # Include listings handled by earlier runs of a resumed job
+            fresh_ids = job_checkpoint.car_ids(checkpoint.SKIPPED)
+            seen_ids = job_checkpoint.car_ids()
+        
+        if index:
+            index.touch(fresh_ids)
+            index.close()
+        
+        if completed:
+            # Heartbeat for skipped listings and removal detection for this search
+            db.sync_listing_scope(scope_key(filters, start_page, end_page, searches), seen_ids, fresh_ids)
+        
+        if job_checkpoint:
+            # An interrupted job keeps its checkpoint for resume
+            if completed:
+                job_checkpoint.complete()
+            job_checkpoint.close()
+        if owns_pool:
+            pool.close()
     
-    # Send remaining records
-    remaining = len(scraped_data) % batch_size
-    if remaining:
-        batch = scraped_data[-remaining:]
-        db.update_wordpress_database(batch)
-        logging.info(f"Final batch: {len(batch)} records sent to WordPress.")
+    if progress:
+        progress.set_stage("done")
     
-    logging.info(f"AWS Scraping complete. Total: {len(scraped_data)} cars, Errors: {len(errors)}")
+    logging.info(f"AWS Scraping complete. Total: {scraped_count[0]} cars, Errors: {len(errors)}")
     
     # Send notification
     if user_email:
         notify_wordpress_scraping_complete(user_email, "Your scraping process is complete.")
     
-    return {"data": scraped_data, "errors": errors}
+    return {"cars": scraped_count[0], "errors": errors}
 
 def notify_wordpress_scraping_complete(user_email, message):
-    WORDPRESS_URL = "https://online-app-flex-cars.com"
-    endpoint = f"{WORDPRESS_URL.rstrip('/')}/wp-json/cars-scraper/v1/scraping-complete"
+    endpoint = f"{db.WORDPRESS_URL.rstrip('/')}/wp-json/cars-scraper/v1/scraping-complete"
     payload = {"user_email": user_email, "message": message}
     
     for attempt in range(5):  # More retries for AWS
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import List, Optional
@@ -9,10 +9,17 @@ import asyncio
 import signal
 import sys
 import os
+import json
+from contextlib import asynccontextmanager
 
 # Import AWS-optimized modules
-import database as db
 import scraper_aws as scraper
+import uploader
+import job_queue
+import checkpoint
+import metrics
+import wordpress_probe
+import scheduler
 
 # Configure logging for AWS
 logging.basicConfig(
@@ -24,10 +31,45 @@ logging.basicConfig(
     ]
 )
 
+# Scrapes run in separate worker processes fed from a durable local queue;
+# each worker keeps its own long-lived Chrome pool.
+supervisor = None
+# Recurring scrape profiles; enqueues their jobs on the supervisor's queue
+schedules = None
+# One shared connection for the checkpoint summaries shown by /tasks/{task_id}
+checkpoints = None
+
+# Cached, non-blocking WordPress check behind /status/ and /wordpress-status/
+wordpress = wordpress_probe.WordPressProbe()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global supervisor, schedules, checkpoints
+    loop = asyncio.get_running_loop()
+    # Only the server resets the shared metrics directory (spawned workers
+    # re-import modules); samples of the previous run's workers would
+    # otherwise be summed into /metrics forever
+    metrics.init(reset=True)
+    supervisor = await loop.run_in_executor(None, lambda: job_queue.WorkerSupervisor().start())
+    schedules = await loop.run_in_executor(None, lambda: scheduler.Scheduler(supervisor.queue).start())
+    checkpoints = await loop.run_in_executor(None, checkpoint.JobCheckpoint, None)
+    # Re-send batches spooled by earlier runs while WordPress was failing
+    loop.run_in_executor(None, uploader.replay_spool)
+    # Warm the probe so the first status poll is answered from cache
+    asyncio.ensure_future(wordpress.check())
+    try:
+        yield
+    finally:
+        await wordpress.close()
+        await loop.run_in_executor(None, schedules.stop)
+        await loop.run_in_executor(None, supervisor.stop)
+        checkpoints.close()
+
 app = FastAPI(
     title="Cars.com Scraper API - AWS",
     description="AWS-optimized API for cars.com scraping with enhanced reliability",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Global exception handler
@@ -73,17 +115,67 @@ class ScrapeRequest(BaseModel):
     start_page: int = Field(default=1, ge=1)
     end_page: int = Field(default=1, ge=1)
     user_email: Optional[str] = Field(default=None)
+    engine: str = Field(default='selenium', pattern='^(selenium|http|async)$')
+    concurrency: Optional[int] = Field(default=None, ge=1, le=500)
+    incremental: bool = Field(default=True)
+    freshness_ttl_hours: float = Field(default=24, gt=0)
+    # Split a broad search into disjoint sub-searches walked in parallel,
+    # each over start_page..end_page (see query_planner)
+    shards: int = Field(default=1, ge=1, le=16)
+    shard_by: Optional[str] = Field(default=None, pattern='^(price|year|make)$')
+    # Debugging aids for a single job; output goes to TRACE_DIR/<task_id>.*
+    trace: bool = Field(default=False)
+    profile: bool = Field(default=False)
 
-# Global task tracking
-active_tasks = set()
+class ScheduleRequest(BaseModel):
+    name: str = Field(min_length=1)
+    scrape: ScrapeRequest
+    interval_minutes: float = Field(ge=scheduler.MIN_INTERVAL_SECONDS / 60)
+    # Time of day (server local, HH:MM) the runs are aligned to, e.g. "02:30" nightly
+    start_at: Optional[str] = Field(default=None, pattern=r'^\d{1,2}:\d{2}$')
+    # Each run starts up to this much after its slot
+    jitter_minutes: float = Field(default=0, ge=0)
+    enabled: bool = Field(default=True)
 
-async def cleanup_task(task_id: str):
-    """Clean up completed tasks"""
-    await asyncio.sleep(1)
-    active_tasks.discard(task_id)
+# Ceiling on detail-page workers per engine; each job starts at half of it
+# and adapts to the site's latency and errors (rate_control). The
+# browserless engines are bound by network, not Chrome.
+ENGINE_MAX_WORKERS = {
+    "selenium": 4,  # One Chrome per worker (WORKER_BROWSER_POOL_SIZE)
+    "http": 32,
+    "async": 200,
+}
+
+def job_params(request: ScrapeRequest):
+    """Job queue params for a scrape request (also what schedules store)"""
+    return dict(
+        engine=request.engine,
+        workers=request.concurrency or ENGINE_MAX_WORKERS[request.engine],
+        stock_type=request.stock_type,
+        makes=request.makes,
+        models=request.models,
+        zip_code=request.zip_code,
+        max_distance=request.max_distance,
+        list_price_min=request.list_price_min,
+        list_price_max=request.list_price_max,
+        year_min=request.year_min,
+        year_max=request.year_max,
+        mileage_max=request.mileage_max,
+        body_styles=request.body_styles,
+        fuel_types=request.fuel_types,
+        start_page=request.start_page,
+        end_page=request.end_page,
+        user_email=request.user_email,
+        incremental=request.incremental,
+        freshness_ttl_hours=request.freshness_ttl_hours,
+        shards=request.shards,
+        shard_by=request.shard_by,
+        trace=request.trace,
+        profile=request.profile
+    )
 
 @app.post("/scrape/", status_code=202)
-async def trigger_scraping(request: ScrapeRequest, background_tasks: BackgroundTasks):
+async def trigger_scraping(request: ScrapeRequest):
     try:
         if request.end_page < request.start_page:
             raise HTTPException(status_code=400, detail="End page cannot be less than start page.")
@@ -91,42 +183,131 @@ async def trigger_scraping(request: ScrapeRequest, background_tasks: BackgroundT
         # Generate task ID
         import uuid
         task_id = str(uuid.uuid4())
-        active_tasks.add(task_id)
-        
-        # Add cleanup task
-        background_tasks.add_task(cleanup_task, task_id)
         
-        # Run scraper in background with AWS optimizations
-        background_tasks.add_task(
-            scraper.scrape_cars,
-            stock_type=request.stock_type,
-            makes=request.makes,
-            models=request.models,
-            zip_code=request.zip_code,
-            max_distance=request.max_distance,
-            list_price_min=request.list_price_min,
-            list_price_max=request.list_price_max,
-            year_min=request.year_min,
-            year_max=request.year_max,
-            mileage_max=request.mileage_max,
-            body_styles=request.body_styles,
-            fuel_types=request.fuel_types,
-            start_page=request.start_page,
-            end_page=request.end_page,
-            max_workers=2,  # Conservative for AWS
-            user_email=request.user_email
-        )
+        # The job is persisted before we answer, so a restart cannot lose it
+        params = job_params(request)
+        await asyncio.to_thread(supervisor.queue.enqueue, task_id, request.engine, params)
         
         return {
-            "message": "Scraping started successfully on AWS. Email notification will be sent upon completion.",
+            "message": "Scraping queued successfully on AWS. Email notification will be sent upon completion.",
             "task_id": task_id,
-            "estimated_pages": request.end_page - request.start_page + 1
+            "estimated_pages": (request.end_page - request.start_page + 1) * request.shards
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error starting scrape: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to start scraping: {str(e)}")
 
+@app.get("/tasks/{task_id}")
+async def get_task(task_id: str):
+    """State of a queued, running or finished scrape job, with live progress"""
+    # Queue and checkpoint reads are SQLite calls; keep them off the event loop
+    job = await asyncio.to_thread(supervisor.queue.get, task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    if job["status"] != job_queue.DONE:
+        job["checkpoint"] = await asyncio.to_thread(checkpoints.summary, task_id)
+    return job
+
+# How often the event stream polls the job record (workers publish every
+# job_queue.HEARTBEAT_INTERVAL seconds)
+TASK_EVENT_POLL_SECONDS = 1.0
+
+@app.get("/tasks/{task_id}/events")
+async def stream_task_events(task_id: str):
+    """Server-sent events with the task's progress until it finishes"""
+    if await asyncio.to_thread(supervisor.queue.get, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+
+    async def events():
+        last = None
+        while True:
+            job = await asyncio.to_thread(supervisor.queue.get, task_id)
+            update = {"status": job["status"], "progress": job["progress"], "error": job["error"]}
+            if update != last:
+                yield f"event: progress\ndata: {json.dumps(update)}\n\n"
+                last = update
+            if job["status"] in (job_queue.DONE, job_queue.FAILED):
+                yield f"event: end\ndata: {json.dumps({'status': job['status'], 'result': job['result']})}\n\n"
+                return
+            await asyncio.sleep(TASK_EVENT_POLL_SECONDS)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/tasks/{task_id}/resume", status_code=202)
+async def resume_task(task_id: str):
+    """Re-queue a failed job; it continues from its last checkpoint"""
+    previous = await asyncio.to_thread(supervisor.queue.resume, task_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    if previous != job_queue.FAILED:
+        raise HTTPException(status_code=409, detail=f"Task is {previous}; only failed tasks can be resumed.")
+    return {"message": "Task re-queued; it will resume from its last checkpoint.", "task_id": task_id}
+
+@app.post("/schedules/", status_code=201)
+async def create_schedule(request: ScheduleRequest):
+    """Save a recurring scrape profile
+
+    Runs of one profile never overlap, and due profiles are launched one at
+    a time (see scheduler). Incremental runs skip listings that are
+    unchanged and were scraped within scrape.freshness_ttl_hours (24 by
+    default, as for one-off jobs). Each listing's TTL is shortened by a
+    per-listing fraction (listing_index.TTL_SPREAD), so listings scraped
+    together are refreshed over several runs rather than all in one.
+    """
+    scrape = request.scrape
+    if scrape.end_page < scrape.start_page:
+        raise HTTPException(status_code=400, detail="End page cannot be less than start page.")
+    if request.jitter_minutes >= request.interval_minutes:
+        raise HTTPException(status_code=400, detail="Jitter must be shorter than the interval.")
+    params = job_params(scrape)
+    interval_seconds = request.interval_minutes * 60
+    try:
+        return await asyncio.to_thread(
+            schedules.add, request.name, scrape.engine, params, interval_seconds,
+            jitter_seconds=request.jitter_minutes * 60, start_at=request.start_at, enabled=request.enabled
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/schedules/")
+async def list_schedules():
+    return {"schedules": await asyncio.to_thread(schedules.list)}
+
+@app.get("/schedules/{schedule_id}")
+async def get_schedule(schedule_id: str):
+    schedule = await asyncio.to_thread(schedules.get, schedule_id)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="Schedule not found.")
+    return schedule
+
+@app.post("/schedules/{schedule_id}/pause")
+async def pause_schedule(schedule_id: str):
+    schedule = await asyncio.to_thread(schedules.set_enabled, schedule_id, False)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="Schedule not found.")
+    return schedule
+
+@app.post("/schedules/{schedule_id}/resume")
+async def resume_schedule(schedule_id: str):
+    """Re-enable a profile; it next runs at its next slot"""
+    schedule = await asyncio.to_thread(schedules.set_enabled, schedule_id, True)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="Schedule not found.")
+    return schedule
+
+@app.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: str):
+    if not await asyncio.to_thread(schedules.remove, schedule_id):
+        raise HTTPException(status_code=404, detail="Schedule not found.")
+    return {"message": "Schedule deleted.", "schedule_id": schedule_id}
+
 @app.get("/health/")
 async def health_check():
     """Enhanced health check for AWS"""
@@ -136,12 +317,14 @@ async def health_check():
         cpu_percent = psutil.cpu_percent()
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
+        workers = await asyncio.to_thread(supervisor.stats)
         
         return {
             "status": "healthy",
             "service": "Cars.com Scraper API - AWS",
             "version": "2.0.0",
-            "active_tasks": len(active_tasks),
+            "active_tasks": workers["jobs"].get(job_queue.RUNNING, 0),
+            "job_workers": workers,
             "system": {
                 "cpu_percent": cpu_percent,
                 "memory_percent": memory.percent,
@@ -152,42 +335,54 @@ async def health_check():
         return {
             "status": "degraded",
             "error": str(e),
-            "active_tasks": len(active_tasks)
+            "active_tasks": (await asyncio.to_thread(supervisor.queue.counts)).get(job_queue.RUNNING, 0)
+            if supervisor else 0
         }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus exposition of scrape-stage, upload and browser-pool metrics from all workers"""
+    body, content_type = await asyncio.to_thread(metrics.render)
+    return Response(content=body, media_type=content_type)
+
 @app.get("/status/")
 async def get_status():
     """Get current scraping status"""
+    jobs = await asyncio.to_thread(supervisor.queue.counts)
     return {
-        "active_tasks": len(active_tasks),
+        "active_tasks": jobs.get(job_queue.RUNNING, 0),
+        "queued_tasks": jobs.get(job_queue.QUEUED, 0),
         "server_status": "running",
         "wordpress_connection": await check_wordpress_connection()
     }
 
 async def check_wordpress_connection():
-    """Check WordPress connectivity"""
-    try:
-        cars_data = db.get_cars_data_from_wordpress(limit=1)
-        return {"status": "connected", "sample_records": len(cars_data)}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    """Check WordPress connectivity (cached; see wordpress_probe)"""
+    probe = await wordpress.check()
+    freshness = {"checked_seconds_ago": probe["age_seconds"], "stale": probe["stale"]}
+    if probe["ok"]:
+        return {"status": "connected", "sample_records": probe["sample_count"], **freshness}
+    return {"status": "error", "message": probe["error"], **freshness}
 
 @app.get("/wordpress-status/")
 async def get_wordpress_status():
-    """Check WordPress REST API status"""
-    try:
-        cars_data = db.get_cars_data_from_wordpress(limit=5)
+    """Check WordPress REST API status (cached; see wordpress_probe)"""
+    probe = await wordpress.check()
+    freshness = {"checked_seconds_ago": probe["age_seconds"], "stale": probe["stale"],
+                 "latency_ms": probe["latency_ms"]}
+    if probe["ok"]:
         return {
             "wordpress_accessible": True,
-            "sample_data_count": len(cars_data),
-            "message": "WordPress REST API is working correctly."
-        }
-    except Exception as e:
-        return {
-            "wordpress_accessible": False,
-            "error": str(e),
-            "message": "WordPress REST API is not accessible."
+            "sample_data_count": probe["sample_count"],
+            "message": "WordPress REST API is working correctly.",
+            **freshness
         }
+    return {
+        "wordpress_accessible": False,
+        "error": probe["error"],
+        "message": "WordPress REST API is not accessible.",
+        **freshness
+    }
 
 # Graceful shutdown handling
 def signal_handler(signum, frame):
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+TRACE_DIR = os.environ.get("TRACE_DIR", "/opt/cars-scraper/traces")
+PROFILE_INTERVAL = 0.01   # seconds between profiler stack samples
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_active = None
+
+class Tracer:
+    """Writes finished spans for one job to a JSONL file
+
+    Each line is an OpenTelemetry-style span: trace_id, span_id,
+    parent_span_id, name, start/end in unix nanoseconds, attributes and a
+    status. Spans opened in worker threads have no parent but carry the
+    attributes (e.g. url) needed to group them.
+    """
+
+    def __init__(self, task_id, trace_dir=TRACE_DIR):
+        os.makedirs(trace_dir, exist_ok=True)
+        self.task_id = task_id
+        self.trace_id = uuid.uuid4().hex
+        self.path = os.path.join(trace_dir, f"{task_id}.jsonl")
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", buffering=1)
+
+    def write(self, span):
+        line = json.dumps(span, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "attributes")
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+_NOOP = _NoopSpan()
+
+def start_trace(task_id, trace_dir=TRACE_DIR):
+    """Start writing spans for task_id; one traced job per process at a time"""
+    global _active
+    _active = Tracer(task_id, trace_dir)
+    logging.info(f"Tracing job {task_id} to {_active.path}")
+    return _active
+
+def stop_trace():
+    global _active
+    tracer, _active = _active, None
+    if tracer:
+        tracer.close()
+
+def enabled():
+    return _active is not None
+
+def _emit(tracer, name, span_id, parent_id, start_ns, end_ns, attributes, error=None):
+    tracer.write({
+        "trace_id": tracer.trace_id,
+        "span_id": span_id,
+        "parent_span_id": parent_id,
+        "name": name,
+        "start_time_unix_nano": start_ns,
+        "end_time_unix_nano": end_ns,
+        "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+        "attributes": attributes,
+        "status": {"code": "ERROR", "message": error} if error else {"code": "OK"},
+    })
+
+@contextmanager
+def span(name, **attributes):
+    """with span("detail_page_load", url=url) as s: ... -- a no-op unless tracing"""
+    tracer = _active
+    if tracer is None:
+        yield _NOOP
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {str(e)[:200]}"
+        raise
+    finally:
+        _current_span.reset(token)
+        _emit(tracer, name, current.span_id, current.parent_id, current.start_ns, time.time_ns(),
+              current.attributes, error)
+
+def current():
+    """The innermost open span in this thread or task (a no-op span when not tracing)"""
+    if _active is None:
+        return _NOOP
+    return _current_span.get() or _NOOP
+
+def record_span(name, seconds, **attributes):
+    """Record an already-measured interval that ended now as a child span"""
+    tracer = _active
+    if tracer is None:
+        return
+    parent = _current_span.get()
+    end_ns = time.time_ns()
+    _emit(tracer, name, uuid.uuid4().hex[:16], parent.span_id if parent else None,
+          end_ns - int(seconds * 1e9), end_ns, attributes)
+
+class SamplingProfiler:
+    """Low-overhead profiler that samples the stacks of every thread
+
+    Unlike cProfile it sees the detail and upload worker threads and the
+    time spent blocked in WebDriverWait or sockets. Writes collapsed stacks
+    (one "frame;frame;frame count" line per stack), which flamegraph.pl and
+    speedscope read directly.
+    """
+
+    def __init__(self, task_id, trace_dir=TRACE_DIR, interval=PROFILE_INTERVAL):
+        os.makedirs(trace_dir, exist_ok=True)
+        self.path = os.path.join(trace_dir, f"{task_id}.folded")
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        with open(self.path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logging.info(f"Profile written to {self.path} ({sum(self.samples.values())} samples)")
+        return self.path
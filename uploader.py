@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import database as db
+import records as car_records
+import metrics
+import tracing
+
+SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", "/opt/cars-scraper/spool")
+
+BATCH_SIZE = 50                    # records per WordPress POST
+MAX_BATCH_BYTES = 512 * 1024       # ...or fewer if the batch JSON would exceed this
+MAX_PENDING_RECORDS = 500          # put() blocks once this many records are waiting
+UPLOAD_CONCURRENCY = 2
+FLUSH_INTERVAL = 5.0               # send a partial batch after this many seconds
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+_CLOSE = object()
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def spool_batch(batch_id, records, spool_dir=SPOOL_DIR):
+    """Write a batch that could not be uploaded to disk for a later replay"""
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(spool_dir, f"{batch_id}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"batch_id": batch_id, "records": records}, f, default=str)
+    os.replace(tmp_path, path)
+    return path
+
+def replay_spool(upload_fn=None, spool_dir=SPOOL_DIR):
+    """Re-send spooled batches oldest first; returns the number replayed"""
+    upload_fn = upload_fn or db.update_wordpress_database
+    if not os.path.isdir(spool_dir):
+        return 0
+
+    replayed = 0
+    paths = sorted(
+        (os.path.join(spool_dir, name) for name in os.listdir(spool_dir) if name.endswith(".json")),
+        key=os.path.getmtime
+    )
+    for path in paths:
+        try:
+            with open(path) as f:
+                spooled = json.load(f)
+            if upload_fn(spooled["records"]):
+                os.remove(path)
+                replayed += 1
+                logging.info(f"Replayed spooled batch {spooled['batch_id']} ({len(spooled['records'])} records)")
+            else:
+                # WordPress is still failing; leave the rest for next time
+                break
+        except Exception as e:
+            logging.error(f"Error replaying spooled batch {path}: {e}")
+    return replayed
+
+class BatchUploader:
+    """Pipelined WordPress uploader fed through a bounded queue
+
+    put() hands a record to a batching thread that cuts batches by record
+    count, payload bytes or age, and uploads them concurrently with
+    exponential-backoff retries. Batches that still fail are spooled to disk
+    for replay_spool(). on_uploaded(batch_id, records) runs after each
+    successful upload and on_spooled(batch_id, records) after a batch is
+    spooled.
+    """
+
+    def __init__(self, upload_fn=None, on_uploaded=None, on_spooled=None, batch_size=BATCH_SIZE,
+                 max_batch_bytes=MAX_BATCH_BYTES, max_pending=MAX_PENDING_RECORDS,
+                 concurrency=UPLOAD_CONCURRENCY, flush_interval=FLUSH_INTERVAL,
+                 max_retries=MAX_RETRIES, spool_dir=SPOOL_DIR):
+        self.upload_fn = upload_fn or db.update_wordpress_database
+        self.on_uploaded = on_uploaded
+        self.on_spooled = on_spooled
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spool_dir = spool_dir
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # Caps batches in flight so the backlog stays bounded end to end
+        self._in_flight = threading.Semaphore(concurrency * 2)
+        self._stats_lock = threading.Lock()
+        self.stats = {"records_sent": 0, "batches_sent": 0, "batches_spooled": 0, "retries": 0}
+
+        self._batcher = threading.Thread(target=self._run, daemon=True)
+        self._batcher.start()
+
+    def put(self, record):
+        # Records travel through the upload backlog as payload dicts; nested
+        # values stay structured until the bulk format decides how to encode them
+        self._queue.put(car_records.as_dict(record, encode_nested=False))
+
+    def _run(self):
+        batch, batch_bytes, started = [], 0, None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, self.flush_interval - (time.time() - started))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _CLOSE:
+                if batch:
+                    self._submit(batch)
+                return
+
+            if item is not None:
+                size = len(json.dumps(item, default=str))
+                if batch and batch_bytes + size > self.max_batch_bytes:
+                    self._submit(batch)
+                    batch, batch_bytes = [], 0
+                if not batch:
+                    started = time.time()
+                batch.append(item)
+                batch_bytes += size
+
+            if batch and (len(batch) >= self.batch_size or item is None):
+                self._submit(batch)
+                batch, batch_bytes = [], 0
+
+    def _submit(self, batch):
+        self._in_flight.acquire()
+        batch_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        future = self._executor.submit(self._upload, batch_id, batch)
+        future.add_done_callback(lambda _: self._in_flight.release())
+
+    def _upload(self, batch_id, batch):
+        count = len(batch)
+        for attempt in range(self.max_retries):
+            try:
+                with tracing.span("upload_batch", batch_id=batch_id, records=count, attempt=attempt + 1) as span:
+                    ok = self.upload_fn(batch)
+                    span.set(ok=bool(ok))
+                if ok:
+                    with self._stats_lock:
+                        self.stats["records_sent"] += count
+                        self.stats["batches_sent"] += 1
+                    logging.info(f"Batch {batch_id} sent: {count} records to WordPress.")
+                    break
+            except Exception as e:
+                logging.error(f"Batch {batch_id} upload error: {e}")
+
+            if attempt < self.max_retries - 1:
+                delay = backoff_delay(attempt)
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                metrics.RETRIES.labels(operation="upload").inc()
+                logging.warning(f"Batch {batch_id} failed (attempt {attempt + 1}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        else:
+            path = spool_batch(batch_id, batch, self.spool_dir)
+            with self._stats_lock:
+                self.stats["batches_spooled"] += 1
+            logging.error(f"Batch {batch_id} failed after {self.max_retries} attempts; spooled to {path}")
+            self._run_hook(self.on_spooled, batch_id, batch)
+            return False
+
+        self._run_hook(self.on_uploaded, batch_id, batch)
+        return True
+
+    def _run_hook(self, hook, batch_id, batch):
+        if hook:
+            try:
+                hook(batch_id, batch)
+            except Exception as e:
+                logging.error(f"Post-upload hook failed for batch {batch_id}: {e}")
+
+    def close(self):
+        """Flush what is queued, wait for in-flight uploads and return stats"""
+        self._queue.put(_CLOSE)
+        self._batcher.join()
+        self._executor.shutdown(wait=True)
+        return dict(self.stats)
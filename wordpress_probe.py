@@ -0,0 +1,86 @@
+import os
+import time
+import asyncio
+import logging
+import httpx
+import database as db
+
+# A probe result is served as-is for FRESH_SECONDS; after that it is still
+# served (marked stale) for up to STALE_SECONDS while one refresh runs in
+# the background. Older results are refreshed before answering.
+FRESH_SECONDS = float(os.environ.get("WORDPRESS_PROBE_TTL", "30"))
+STALE_SECONDS = float(os.environ.get("WORDPRESS_PROBE_STALE_TTL", "300"))
+PROBE_TIMEOUT = 10.0
+SAMPLE_LIMIT = 5   # /wordpress-status/ shows up to 5 sample records; /status/ shares the same probe
+
+class WordPressProbe:
+    """Async, cached WordPress connectivity and sample-data check
+
+    All callers share one cached result. Concurrent callers that need a
+    refresh wait on the same upstream request (single-flight), and a stale
+    result is returned immediately while it is revalidated in the
+    background, so status endpoints never block the event loop on WordPress.
+    """
+
+    def __init__(self, api_base=db.API_BASE, auth=db.WORDPRESS_AUTH, fresh_seconds=FRESH_SECONDS,
+                 stale_seconds=STALE_SECONDS, timeout=PROBE_TIMEOUT, limit=SAMPLE_LIMIT):
+        self.api_base = api_base
+        self.auth = auth
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.timeout = timeout
+        self.limit = limit
+        self._client = None
+        self._result = None
+        self._inflight = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                auth=self.auth,
+                timeout=httpx.Timeout(self.timeout),
+                headers={"Accept-Encoding": "gzip, deflate"}
+            )
+        return self._client
+
+    async def _fetch(self):
+        started = time.time()
+        try:
+            response = await self._get_client().get(
+                f"{self.api_base}/get-cars-data", params={"limit": self.limit}
+            )
+            response.raise_for_status()
+            cars = response.json().get("cars_data", [])
+            result = {"ok": True, "sample_count": len(cars), "error": None}
+        except Exception as e:
+            logging.warning(f"WordPress probe failed: {e}")
+            result = {"ok": False, "sample_count": 0, "error": str(e)[:200] or type(e).__name__}
+        result["checked_at"] = time.time()
+        result["latency_ms"] = round((result["checked_at"] - started) * 1000, 1)
+        self._result = result
+        return result
+
+    def _refresh(self):
+        """The in-flight probe, starting one if none is running"""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._fetch())
+        return self._inflight
+
+    async def check(self):
+        """Latest probe result with its age; refreshes according to the TTLs"""
+        result = self._result
+        age = time.time() - result["checked_at"] if result else None
+        if result is None or age >= self.stale_seconds:
+            # shield: a caller that disconnects must not cancel the shared probe
+            result = await asyncio.shield(self._refresh())
+            age = time.time() - result["checked_at"]
+        elif age >= self.fresh_seconds:
+            self._refresh()
+        return dict(result, age_seconds=round(age, 1), stale=age >= self.fresh_seconds)
+
+    async def close(self):
+        if self._inflight is not None and not self._inflight.done():
+            self._inflight.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None